@@ -1,5 +1,7 @@
 import logging
 import asyncio
+import concurrent.futures
+import multiprocessing
 import time
 import json
 import sqlite3
@@ -14,10 +16,22 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 import httpx
-import curl_cffi
 
+import analytics
+import api
+import checkpoint
 import config
 import db
+import expiry
+from floor_index import FloorIndex
+import history
+import pipeline
+import recorder
+import scanner
+import settings_store
+import tonnel
+import tracing
+import watchlist
 
 # ⚙️ Настройки логирования
 logging.basicConfig(
@@ -31,15 +45,58 @@ bot = Bot(token=config.TELEGRAM_BOT_TOKEN)
 dp = Dispatcher()
 
 # 🔧 Настройки пользователя в оперативной памяти (для текущего сеанса)
-# В этот словарь будем кэшировать настройки пользователей из БД + временный notified_ids
-user_settings = {}
+# Кэш настроек пользователей из БД + временный notified_ids в компактном хранилище с массивами по слотам
+user_settings = settings_store.SettingsStore()
 
-# Инициализируем сессию curl_cffi с имитацией Chrome
-session = curl_cffi.Session(impersonate="chrome131")
+# Сканируемые валюты: из config.SCAN_ASSETS остаются те, для которых известна floor-цена
+scan_assets = scanner.enabled_assets(config.SCAN_ASSETS)
+
+# Кэш floor-цен из filterStats по валютам, в которых их отдаёт tonnel (только TON):
+# asset -> {ключ "Имя_Модель" -> floorPrice, время обновления, валидаторы ответа (ETag / Last-Modified)}
+floor_caches = {
+    scanner.DEFAULT_ASSET: {'prices': {}, 'updated_at': 0.0, 'etag': None, 'last_modified': None}
+}
+
+# Пул процессов для разбора больших ответов filterStats вне event loop, создаётся в main()
+decode_executor = None
+
+# Индексы floor-цен по названию / модели / фону для каждой валюты кэша, перестраиваются при обновлении кэша
+floor_indexes = {asset: FloorIndex() for asset in floor_caches}
+
+# Инкрементальная аналитика ставок по активным аукционам (скорость ставок, прогноз итоговой ставки)
+bid_tracker = analytics.BidTracker()
+
+# Последний снимок активных аукционов из pageGifts (объединённый по всем валютам) и время его получения
+auction_snapshot = {'auctions': [], 'fetched_at': 0.0}
+
+# Запись сырых ответов tonnel для последующего воспроизведения (replay.py), создаётся в main(), если включена в конфиге
+auction_recorder: recorder.AuctionRecorder = None
+
+# Клиент tonnel (curl_cffi с имитацией Chrome) с повторами, circuit breaker и hedged-запросами
+tonnel_client = tonnel.TonnelClient()
+
+# История отправленных уведомлений: пишется в БД пачками фоновой задачей
+alert_history = history.AlertHistoryWriter()
+
+# Трассировка задержки от появления лота в снимке до доставки уведомления (файл + сводка в памяти для /latency),
+# создаётся в main()
+latency_tracer: tracing.LatencyTracer = None
 
 # Планировщик задач
 scheduler = AsyncIOScheduler()
 
+# Конвейер сканирования аукционов (fetch → parse → enrich → match → deliver), создаётся в main()
+scan_pipeline: pipeline.ScanPipeline = None
+
+# Скомпилированные списки отслеживания / блокировки пользователей, перестраиваются при их изменении
+watchlists = watchlist.WatchlistIndex()
+
+# Отслеживание окончания подписок (min-куча по end_date), заполняется в main()
+expiry_scheduler = expiry.ExpiryScheduler()
+
+# Встроенный HTTP API снимка выгодных лотов, запускается в main(), если включён в конфиге
+deals_api: api.DealsApi = None
+
 # Переменная для хранения юзернейма бота
 bot_username: str = None # Указываем тип для ясности, будет установлен в main()
 
@@ -49,71 +106,236 @@ def get_user_actual_settings(user_id: int) -> dict:
     """
     Получает текущие настройки пользователя, загружая их из БД, если они ещё не в кэше.
     """
-    if user_id not in user_settings:
-        user_settings[user_id] = db.get_user_prefs(user_id)
-        # Убедимся, что notified_ids всегда set() при первом получении
-        if 'notified_ids' not in user_settings[user_id]:
-            user_settings[user_id]['notified_ids'] = set()
-    return user_settings[user_id]
+    settings = user_settings.get(user_id)
+    if settings is None:
+        # notified_ids хранилище заводит само, при первом уведомлении
+        settings = user_settings.add(user_id, db.get_user_prefs(user_id))
+    return settings
 
-def get_floor_price(name, model):
+async def refresh_floor_prices(asset: str) -> bool:
     """
-    Получает минимальную (floor) цену для конкретного подарка (по имени и модели)
-    с помощью API gifts3.tonnel.network/api/filterStats.
+    Загружает статистику filterStats валюты asset целиком, сохраняет floor-цены всех моделей в её кэш
+    и перестраивает её индекс. Возвращает True, если кэш обновлён.
     """
-    key = f"{name}_{model}"
+    floor_cache = floor_caches[asset]
     try:
-        # Ключ в payload должен быть "authData", как показано на скриншотах
-        payload = {
-            "authData": config.AUTH_DATA # Отправляем AUTH_DATA как строку
-        }
-
-        # Отправляем POST-запрос с помощью curl_cffi session
-        res = session.post(
-            "https://gifts3.tonnel.network/api/filterStats",
-            headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 OPR/112.0.0.0",
-                "Accept": "*/*",
-                "Accept-Language": "en-US,en;q=0.5",
-                "Referer": "https://market.tonnel.network/",
-                "Content-Type": "application/json", # Важно: указываем JSON тип контента
-                "Origin": "https://market.tonnel.network",
-                "Connection": "keep-alive",
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "cross-site",
-                "Sec-GPC": "1",
-                "Priority": "u=4",
-            },
-            json=payload, # Отправляем данные как JSON
-            timeout=10, # Таймаут для запроса
-            verify=False # ВНИМАНИЕ: Отключение проверки SSL-сертификата не рекомендуется в продакшене!
-        )
-
-        # Проверяем статус код HTTP ответа
-        if res.status_code != 200:
-            logger.error("[ERROR] floorPrice: HTTP %s - %s", res.status_code, res.text)
-            return None
-
-        # Пробуем декодировать ответ как JSON
+        res = await tonnel_client.fetch_filter_stats(floor_cache.get('etag'), floor_cache.get('last_modified'))
+        if res is None:
+            return False
+
+        if res.status_code == 304:
+            # Статистика не изменилась с прошлого запроса — индекс остаётся прежним
+            floor_cache['updated_at'] = time.time()
+            logger.debug("filterStats %s не изменился (304), используется текущий индекс floor-цен.", asset)
+            return True
+
+        # Большие ответы разбираются в отдельном процессе, чтобы не блокировать event loop;
+        # обратно передаются только floorPrice
+        body = res.content
         try:
-            data = res.json()
+            if decode_executor is not None and len(body) >= config.JSON_OFFLOAD_THRESHOLD:
+                prices = await asyncio.get_running_loop().run_in_executor(decode_executor, scanner.extract_floor_prices, body)
+            else:
+                prices = scanner.extract_floor_prices(body)
         except json.JSONDecodeError:
-            logger.warning("[WARN] floorPrice: Не удалось декодировать JSON из ответа:\n%s", res.text[:500])
-            return None
-
-        # Ожидаем, что ответ будет словарем с ключом 'data',
-        # и внутри него статистика по ключам вида "ИмяПодарка_МодельПодарка"
-        # Пример ожидаемой структуры: {"data": {"GiftName_ModelName": {"floorPrice": 123.45, ...}}}
-        floor_data = data.get("data", {})
-        return floor_data.get(key, {}).get("floorPrice")
+            logger.warning("[WARN] floorPrice %s: Не удалось декодировать JSON из ответа:\n%s", asset, res.text[:500])
+            return False
+
+        if auction_recorder:
+            auction_recorder.record("filterStats", body, asset=asset)
+
+        floor_cache['prices'] = prices
+        floor_cache['updated_at'] = time.time()
+        floor_cache['etag'] = res.headers.get("ETag")
+        floor_cache['last_modified'] = res.headers.get("Last-Modified")
+        # Индекс строится один раз на обновление, дальше поиск по нему не требует разбора ключей
+        floor_indexes[asset] = FloorIndex.build(floor_cache['prices'])
+        return True
 
     except Exception as e:
-        logger.error("[ERROR] Ошибка при получении floor price для %s_%s: %s", name, model, e)
+        logger.error("[ERROR] Ошибка при обновлении floor price %s: %s", asset, e)
+        return False
+
+async def ensure_floor_prices():
+    """
+    Обновляет floor-цены, если кэш старше FLOOR_CACHE_TTL секунд.
+    При ошибке обновления (или разомкнутом circuit breaker) остаются последние известные цены.
+    """
+    now = time.time()
+    stale = [asset for asset, floor_cache in floor_caches.items() if now - floor_cache['updated_at'] > config.FLOOR_CACHE_TTL]
+    if stale:
+        await asyncio.gather(*(refresh_floor_prices(asset) for asset in stale))
+
+def get_floor_price(name, model, backdrop=None, asset=scanner.DEFAULT_ASSET):
+    """
+    Получает минимальную (floor) цену для конкретного подарка в валюте asset: по названию, модели и фону,
+    с откатом к названию + модели и к одному названию. Возвращает (floor-цена, уровень).
+    Цены берутся из индекса TON и для других валют пересчитываются по курсу (scanner.convert_floor).
+    Индексы обновляются через ensure_floor_prices() один раз за тик.
+    """
+    floor_price, floor_level = floor_indexes[scanner.DEFAULT_ASSET].lookup(name, model, backdrop)
+    floor_price = scanner.convert_floor(floor_price, asset)
+    if floor_price is None:
+        return None, None
+    return floor_price, floor_level
+
+async def fetch_asset_auctions(asset: str) -> list | None:
+    """
+    Запрашивает активные аукционы в валюте asset через pageGifts.
+    Возвращает список аукционов (с проставленными полями asset и fetched_at) или None при ошибке.
+    """
+    res = await tonnel_client.fetch_page_gifts(asset)
+    if res is None:
+        return None
+    fetched_at = time.time()
+
+    try:
+        data = scanner.loads(res.content)
+    except json.JSONDecodeError:
+        logger.warning("[WARN] pageGifts %s: Не удалось декодировать JSON из ответа:\n%s", asset, res.text[:500])
         return None
 
+    if auction_recorder:
+        auction_recorder.record("pageGifts", res.content, asset=asset)
+
+    auctions = scanner.parse_auctions(data)
+    for gift in auctions:
+        gift['asset'] = asset
+        # Время ответа остаётся у лота и в следующих тиках, если снимок этой валюты используется повторно
+        gift['fetched_at'] = fetched_at
+    return auctions
+
+async def fetch_auctions() -> list | None:
+    """
+    Запрашивает аукционы всех сканируемых валют параллельно (время тика — по самому медленному
+    запросу) и сохраняет объединённый снимок в auction_snapshot. Для валюты, которую получить не удалось,
+    берутся её аукционы из прошлого снимка, и время снимка остаётся прежним (по самой старой части).
+    Возвращает список аукционов или None, если не удалось ни одной.
+    """
+    results = await asyncio.gather(*(fetch_asset_auctions(asset) for asset in scan_assets))
+    if all(result is None for result in results):
+        return None
+
+    auctions = []
+    fell_back = False
+    for asset, result in zip(scan_assets, results):
+        if result is None:
+            fell_back = True
+            result = [gift for gift in auction_snapshot['auctions'] if gift.get('asset', scanner.DEFAULT_ASSET) == asset]
+            logger.warning("Аукционы %s получить не удалось, используются данные прошлого снимка (%d шт.)", asset, len(result))
+        auctions.extend(result)
+
+    auction_snapshot['auctions'] = auctions
+    if not fell_back:
+        auction_snapshot['fetched_at'] = time.time()
+    logger.info("Найдено активных аукционов: %d", len(auctions))
+    return auctions
+
+def reload_watchlists():
+    """Перестраивает индекс списков отслеживания и блокировки из БД и передаёт его конвейеру."""
+    global watchlists
+    watchlists = watchlist.WatchlistIndex.build(db.get_all_user_filters())
+    if scan_pipeline is not None:
+        scan_pipeline.filters = watchlists
+
+# --- Контрольные точки состояния сканера ---
+
+def collect_scanner_state() -> dict:
+    """
+    Собирает состояние сканера для сохранения: уже отправленные пользователям лоты (notified_ids),
+    floor-цены, последний снимок аукционов и статистику ставок. Настройки пользователей не сохраняются:
+    их источник — БД, куда команды пишут сразу.
+    """
+    return {
+        'notified_ids': user_settings.notified_by_user(),
+        'floor_caches': {asset: dict(floor_cache) for asset, floor_cache in floor_caches.items()},
+        'auction_snapshot': dict(auction_snapshot),
+        'bid_tracker': dict(bid_tracker.stats),
+    }
+
+def restore_scanner_state() -> bool:
+    """
+    Восстанавливает состояние сканера из контрольной точки, если она есть.
+    Вызывается в main() до первого тика, чтобы перезапуск не вызывал лишних запросов и повторных уведомлений.
+    """
+    state = checkpoint.load_checkpoint(config.CHECKPOINT_PATH)
+    if not state:
+        return False
+    # Настройки берутся из БД: контрольная точка может быть старше последних /set* и /stop
+    saved_notified = state.get('notified_ids')
+    if saved_notified is None:
+        # Контрольная точка старого формата хранила настройки целиком, из них нужны только notified_ids
+        saved_notified = {user_id: prefs.get('notified_ids') for user_id, prefs in state.get('user_settings', {}).items()}
+    for user_id, notified_ids in saved_notified.items():
+        if notified_ids:
+            get_user_actual_settings(user_id)['notified_ids'] = notified_ids
+    saved_caches = state.get('floor_caches')
+    if saved_caches is None and 'floor_cache' in state:
+        # Контрольная точка до появления нескольких валют: кэш относится к TON
+        saved_caches = {scanner.DEFAULT_ASSET: state['floor_cache']}
+    for asset, saved_cache in (saved_caches or {}).items():
+        if asset in floor_caches:
+            floor_caches[asset].update(saved_cache)
+            floor_indexes[asset] = FloorIndex.build(floor_caches[asset]['prices'])
+    auction_snapshot.update(state.get('auction_snapshot', {}))
+    bid_tracker.stats.update(state.get('bid_tracker', {}))
+    logger.info("Состояние сканера восстановлено: пользователей %d, floor-цен %d, аукционов в снимке %d",
+                len(user_settings), sum(len(cache['prices']) for cache in floor_caches.values()),
+                len(auction_snapshot['auctions']))
+    return True
+
+async def save_scanner_state():
+    """
+    Сохраняет состояние сканера в контрольную точку.
+    Корутина, чтобы APScheduler выполнял её в event loop, а не в отдельном потоке параллельно со сканером.
+    """
+    try:
+        checkpoint.save_checkpoint(config.CHECKPOINT_PATH, collect_scanner_state())
+    except Exception as e:
+        logger.error("Не удалось сохранить состояние сканера: %s", e)
+
 # --- Функции проверки подписки ---
 
+def extend_subscriptions(user_ids: list, period_seconds: float) -> dict:
+    """
+    Продлевает подписку пользователям (end_date = max(end_date, сейчас) + period_seconds) одной транзакцией,
+    активирует бота для них в БД и в кэше настроек и передаёт новые даты планировщику окончаний подписок.
+    Возвращает {user_id: новая end_date}.
+    """
+    end_dates = db.extend_subscriptions(user_ids, period_seconds)
+    for user_id, end_date in end_dates.items():
+        expiry_scheduler.update(user_id, end_date)
+        settings = user_settings.get(user_id)
+        if settings is not None:
+            settings['active'] = True
+    return end_dates
+
+async def expire_subscription(user_id: int):
+    """
+    Деактивирует бота для пользователя, чья подписка закончилась, и сообщает ему об этом.
+    Вызывается планировщиком окончаний подписок в момент окончания подписки.
+    """
+    if db.is_admin(user_id):
+        return
+
+    current_settings = get_user_actual_settings(user_id)
+    if not current_settings['active']:
+        return
+
+    current_settings['active'] = False
+    # Сохраняем изменение статуса активности в БД
+    db.set_user_prefs(user_id, current_settings['min_profit'], current_settings['interval'],
+                      current_settings['price_range'][0], current_settings['price_range'][1], False)
+    try:
+        await bot.send_message(
+            chat_id=user_id,
+            text="Ваша подписка истекла. Пожалуйста, продлите её, чтобы продолжить использование бота. "
+                 "Используйте команду /subscribe."
+        )
+    except Exception as e:
+        logger.warning(f"Не удалось отправить сообщение об истечении подписки пользователю {user_id}: {e}")
+    logger.info("Подписка пользователя %s истекла. Бот деактивирован.", user_id)
+
 async def check_subscription_status(user_id: int, message_or_query: types.Message | types.CallbackQuery) -> bool:
     """
     Проверяет статус подписки пользователя.
@@ -123,26 +345,13 @@ async def check_subscription_status(user_id: int, message_or_query: types.Messag
     if db.is_admin(user_id):
         return True
 
-    end_date = db.get_subscription_end_date(user_id)
-    if time.time() < end_date:
+    if expiry_scheduler.is_active(user_id):
         return True
     else:
         current_settings = get_user_actual_settings(user_id)
         if current_settings['active']:
-            current_settings['active'] = False
-            # Сохраняем изменение статуса активности в БД
-            db.set_user_prefs(user_id, current_settings['min_profit'], current_settings['interval'], 
-                              current_settings['price_range'][0], current_settings['price_range'][1], current_settings['active'])
-            # Если бот активен, но подписка истекла, отправляем сообщение.
-            try:
-                await bot.send_message(
-                    chat_id=user_id,
-                    text="Ваша подписка истекла. Пожалуйста, продлите её, чтобы продолжить использование бота. "
-                         "Используйте команду /subscribe."
-                )
-            except Exception as e:
-                logger.warning(f"Не удалось отправить сообщение об истечении подписки пользователю {user_id}: {e}")
-            logger.info("Подписка пользователя %s истекла. Бот деактивирован.", user_id)
+            # Подписка только что истекла, а планировщик окончаний ещё не успел её обработать
+            await expire_subscription(user_id)
         else:
             # Если подписки нет, и пользователь пытался использовать команду/кнопку
             try:
@@ -165,6 +374,29 @@ async def check_subscription_status(user_id: int, message_or_query: types.Messag
 
 # --- Основная логика проверки аукционов ---
 
+async def get_tick_auctions(max_interval: int) -> list | None:
+    """
+    Стадия fetch конвейера: возвращает аукционы для текущего тика и обновляет floor-цены.
+    Список аукционов одинаков для всех пользователей, поэтому запрашивается один раз за тик.
+    """
+    # Если снимок ещё свежий (например, восстановлен из контрольной точки сразу после перезапуска),
+    # используем его без обращения к tonnel.
+    snapshot_age = time.time() - auction_snapshot['fetched_at']
+    if snapshot_age < max_interval:
+        auctions = auction_snapshot['auctions']
+        logger.info("Используется сохранённый снимок аукционов (%d шт.)", len(auctions))
+    elif tonnel_client.breaker.is_open:
+        # Upstream нездоров: не отправляем запросы, пока цепь разомкнута, и работаем по последним данным
+        auctions = auction_snapshot['auctions']
+        logger.warning("tonnel недоступен (circuit breaker разомкнут), используется снимок аукционов возрастом %.0f сек.", snapshot_age)
+    else:
+        auctions = await fetch_auctions()
+        if auctions is None:
+            return None
+
+    await ensure_floor_prices()
+    return auctions
+
 async def check_auctions_job():
     """
     Асинхронная функция для периодической проверки активных аукционов.
@@ -192,8 +424,8 @@ async def check_auctions_job():
             current_settings = get_user_actual_settings(user_id) # Получаем настройки (из кэша или БД)
 
             is_user_admin = db.is_admin(user_id)
-            end_date = db.get_subscription_end_date(user_id)
-            has_active_subscription = time.time() < end_date
+            # Окончание подписок отслеживает expiry_scheduler, здесь только читаем дату из памяти
+            has_active_subscription = expiry_scheduler.is_active(user_id)
 
             # Если пользователь админ ИЛИ у него активная подписка, то он считается активным
             if is_user_admin or has_active_subscription:
@@ -204,16 +436,7 @@ async def check_auctions_job():
                     logger.info("Пользователь %s стал активным (подписка/админ).", user_id)
                 active_users_for_check.append(user_id)
             else:
-                # Если подписка истекла и не админ
-                if current_settings['active']: # Если ранее был активен, но подписка истекла
-                    current_settings['active'] = False # Деактивируем его в кэше
-                    db.set_user_prefs(user_id, current_settings['min_profit'], current_settings['interval'], 
-                                      current_settings['price_range'][0], current_settings['price_range'][1], False)
-                    try:
-                        await bot.send_message(chat_id=user_id, text="Ваша подписка истекла. Пожалуйста, продлите её, чтобы продолжить использование бота. Используйте команду /subscribe.")
-                    except Exception as e:
-                        logger.warning("Не удалось отправить сообщение пользователю %s о закончившейся подписке: %s", user_id, e)
-                    logger.info("Подписка пользователя %s истекла. Бот деактивирован.", user_id)
+                # Деактивацию и уведомление об истечении подписки выполняет expiry_scheduler
                 logger.debug("Бот не активен для пользователя %s. Пропуск проверки аукционов.", user_id)
 
         if not active_users_for_check:
@@ -226,117 +449,12 @@ async def check_auctions_job():
         max_interval = max(intervals) if intervals else config.DEFAULT_INTERVAL
 
 
-        for user_id in active_users_for_check:
-            current_settings = get_user_actual_settings(user_id) # Получаем настройки для текущего пользователя
-            
-            try:
-                payload = {
-                    "page": 1,
-                    "limit": 30,
-                    "sort": '{"auctionEndTime":1,"gift_id":-1}',
-                    "filter": '{"auction_id":{"$exists":true},"status":"active","asset":"TON"}',
-                    "price_range": None,
-                    "ref": 0,
-                    "user_auth": config.AUTH_DATA # <--- ИСПОЛЬЗУЕМ config.AUTH_DATA
-                }
-
-                res = session.post(
-                    "https://gifts3.tonnel.network/api/pageGifts",
-                    headers={
-                        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 OPR/112.0.0.0",
-                        "Accept": "*/*",
-                        "Accept-Language": "en-US,en;q=0.5",
-                        "Referer": "https://market.tonnel.network/",
-                        "Content-Type": "application/json",
-                        "Origin": "https://market.tonnel.network",
-                        "Connection": "keep-alive",
-                        "Sec-Fetch-Dest": "empty",
-                        "Sec-Fetch-Mode": "cors",
-                        "Sec-Fetch-Site": "cross-site",
-                        "Sec-GPC": "1",
-                        "Priority": "u=4",
-                    },
-                    json=payload,
-                    timeout=10,
-                    verify=False # <--- ИСПОЛЬЗУЕМ verify=False как временное решение
-                )
-
-                if res.status_code != 200:
-                    logger.error("[ERROR] check_auctions_job (для %s): HTTP %s - %s", user_id, res.status_code, res.text)
-                    continue
-
-                try:
-                    data = res.json()
-                except json.JSONDecodeError:
-                    logger.warning("[WARN] check_auctions_job (для %s): Не удалось декодировать JSON из ответа:\n%s", user_id, res.text[:500])
-                    continue
-
-                auctions = data if isinstance(data, list) else data.get('auctions', [])
-                logger.info("Для пользователя %s: Найдено активных аукционов: %d", user_id, len(auctions))
-
-                for gift in auctions:
-                    gift_id = gift.get('gift_id')
-                    if gift_id is None:
-                        logger.warning("Объект подарка без gift_id для пользователя %s: %s", user_id, gift)
-                        continue
-
-                    # Проверка, был ли этот подарок уже уведомлен в текущей сессии
-                    if gift_id in current_settings['notified_ids']:
-                        continue
-
-                    name = gift.get('name', 'N/A')
-                    model = gift.get('model', 'N/A')
-                    backdrop = gift.get('backdrop', 'N/A')
-                    auction_data = gift.get('auction', {})
-                    bid_history = auction_data.get('bidHistory', [])
-
-                    bid = float(bid_history[-1]['amount']) if bid_history else float(auction_data.get('startingBid', 0))
-
-                    end_time_raw = auction_data.get('auctionEndTime', '')
-                    end_time = end_time_raw[:19].replace('T',' ') if end_time_raw else 'N/A'
-
-                    gift_num = gift.get('gift_num', gift.get('gift_id', 'N/A'))
-
-                    min_price_range, max_price_range = current_settings['price_range']
-                    if not (min_price_range <= bid <= max_price_range):
-                        logger.debug("Аукцион %s (ставка %.2f) вне диапазона цен %s для пользователя %s",
-                                     gift_id, bid, current_settings['price_range'], user_id)
-                        continue
-
-                    min_price = get_floor_price(name, model)
-                    if min_price is None:
-                        logger.warning("Не удалось получить floor price для %s_%s. Пропускаем подарок %s для пользователя %s.", name, model, gift_id, user_id)
-                        continue
-                    
-                    floor_with_markup = min_price * 1.06
-                    after_commission = floor_with_markup * 0.9
-                    profit = after_commission - bid
-                    percent = (profit / bid) * 100 if bid > 0 else -100
-
-                    if percent < current_settings['min_profit']:
-                        logger.debug("Аукцион %s (прибыль %.1f%%) ниже минимальной прибыли %d%% для пользователя %s",
-                                    gift_id, percent, current_settings['min_profit'], user_id)
-                        continue
-
-                    gift_link = f"https://t.me/tonnel_network_bot/gift?startapp={gift_num}" if gift_num != 'N/A' else 'Ссылка недоступна'
-
-                    message_text = (
-                        f"🎁Название: {name}\n"
-                        f"Модель: {model}\n"
-                        f"Фон: {backdrop}\n"
-                        f"⏳Заканчивается: {end_time}\n"
-                        f"💰Ставка: {bid:.2f} TON\n"
-                        f"Tonnel Floor: {min_price:.2f} TON\n"
-                        f"💵Прибыль: +{percent:.1f}% ({profit:.2f} TON)\n"
-                        f"🔗Прямая ссылка: {gift_link}"
-                    )
-
-                    await bot.send_message(chat_id=user_id, text=message_text) # Используем глобальный 'bot'
-                    logger.info("Отправлено уведомление о подарке %s (прибыль %.1f%%) пользователю %s", gift_id, percent, user_id)
-                    current_settings['notified_ids'].add(gift_id)
-
-            except Exception as e:
-                logger.error("[ERROR] Общая ошибка в check_auctions_job для пользователя %s: %s", user_id, e)
+        try:
+            if not await scan_pipeline.run_tick(lambda: get_tick_auctions(max_interval), active_users_for_check):
+                await asyncio.sleep(max_interval)
+                continue
+        except Exception as e:
+            logger.error("[ERROR] Общая ошибка в check_auctions_job: %s", e)
         
         await asyncio.sleep(max_interval) # Ждем наибольший интервал среди активных пользователей
 
@@ -405,7 +523,7 @@ async def stop_command(message: types.Message):
             return
 
     current_settings['active'] = False
-    current_settings['notified_ids'].clear()
+    current_settings['notified_ids'] = set()
     db.set_user_prefs(user_id, current_settings['min_profit'], current_settings['interval'], current_settings['price_range'][0], current_settings['price_range'][1], False) # Сохраняем флаг active
     await message.reply("Уведомления остановлены.")
     logger.info("Бот остановлен для пользователя %s", user_id)
@@ -431,11 +549,16 @@ async def settings_command(message: types.Message):
         f"Статус подписки: {sub_status}\n"
         f"Интервал проверки: {current_settings['interval']} секунд\n"
         f"Минимальная прибыль: {current_settings['min_profit']}%\n"
-        f"Диапазон ставок: от {current_settings['price_range'][0]} до {current_settings['price_range'][1]} TON\n\n"
+        f"Диапазон ставок: от {current_settings['price_range'][0]} до {current_settings['price_range'][1]} TON\n"
+        f"Дайджест: {'включен' if current_settings.get('digest') else 'выключен'}\n"
+        f"Валюты аукционов: {', '.join(current_settings.get('assets') or scan_assets)}\n\n"
         f"Для изменения настроек используйте:\n"
         f"/setprofit <процент>\n"
         f"/setinterval <секунды>\n"
-        f"/setpricerange <мин_тон> <макс_тон>"
+        f"/setpricerange <мин_тон> <макс_тон>\n"
+        f"/digest <on|off>\n"
+        f"/setassets <валюта ...|all>\n"
+        f"/watch, /block, /lists — списки отслеживания и блокировки"
     )
     await message.reply(msg_text)
     logger.info("Настройки запрошены пользователем %s", user_id)
@@ -458,6 +581,9 @@ async def set_profit_command(message: types.Message):
         if profit < 0:
             await message.reply("Процент прибыли не может быть отрицательным.")
             return
+        if profit > config.MAX_MIN_PROFIT:
+            await message.reply(f"Процент прибыли не может быть больше {config.MAX_MIN_PROFIT}%.")
+            return
         current_settings = get_user_actual_settings(user_id)
         current_settings['min_profit'] = profit
         db.set_user_prefs(user_id, profit, current_settings['interval'], current_settings['price_range'][0], current_settings['price_range'][1], current_settings['active'])
@@ -484,6 +610,9 @@ async def set_interval_command(message: types.Message):
         if interval < 5:
             await message.reply("Интервал не может быть меньше 5 секунд.")
             return
+        if interval > config.MAX_INTERVAL:
+            await message.reply(f"Интервал не может быть больше {config.MAX_INTERVAL} секунд.")
+            return
         current_settings = get_user_actual_settings(user_id)
         current_settings['interval'] = interval
         db.set_user_prefs(user_id, current_settings['min_profit'], interval, current_settings['price_range'][0], current_settings['price_range'][1], current_settings['active'])
@@ -519,6 +648,241 @@ async def set_price_range_command(message: types.Message):
     except ValueError:
         await message.reply("Неверный формат числа. Пожалуйста, введите числа.")
 
+@dp.message(Command("digest"))
+async def digest_command(message: types.Message):
+    """
+    Обработчик команды /digest. Включает или выключает режим дайджеста:
+    все находки за одну проверку приходят одним сообщением, отсортированные по прибыли.
+    """
+    user_id = message.from_user.id
+    if not await check_subscription_status(user_id, message):
+        return
+
+    args = message.text.split()[1:]
+    if len(args) != 1 or args[0].lower() not in ("on", "off"):
+        await message.reply("Пожалуйста, укажите on или off. Пример: /digest on")
+        return
+
+    digest = args[0].lower() == "on"
+    current_settings = get_user_actual_settings(user_id)
+    current_settings['digest'] = digest
+    db.set_user_digest(user_id, digest)
+    if digest:
+        await message.reply("Режим дайджеста включен: найденные за одну проверку аукционы придут одним сообщением.")
+    else:
+        await message.reply("Режим дайджеста выключен: каждый аукцион приходит отдельным сообщением.")
+    logger.info("Пользователь %s установил режим дайджеста: %s", user_id, digest)
+
+@dp.message(Command("setassets"))
+async def set_assets_command(message: types.Message):
+    """
+    Обработчик команды /setassets. Выбирает валюты аукционов (из сканируемых scan_assets),
+    о которых приходят уведомления. /setassets all — все сканируемые валюты.
+    """
+    user_id = message.from_user.id
+    if not await check_subscription_status(user_id, message):
+        return
+
+    args = [arg.upper() for arg in message.text.split()[1:]]
+    available = ", ".join(scan_assets)
+    if not args:
+        await message.reply(f"Пожалуйста, укажите валюты или all. Доступны: {available}. Пример: /setassets {scan_assets[0]}")
+        return
+
+    if args == ["ALL"]:
+        assets = None
+    else:
+        unknown = [asset for asset in args if asset not in scan_assets]
+        if unknown:
+            await message.reply(f"Валюты {', '.join(unknown)} не сканируются. Доступны: {available}.")
+            return
+        assets = tuple(dict.fromkeys(args))
+
+    current_settings = get_user_actual_settings(user_id)
+    current_settings['assets'] = assets
+    db.set_user_assets(user_id, assets)
+    await message.reply(f"Валюты аукционов: {', '.join(assets or scan_assets)}.")
+    logger.info("Пользователь %s выбрал валюты аукционов: %s", user_id, assets or "все")
+
+def build_deals_page(user_id: int, page: int) -> tuple[str, InlineKeyboardMarkup | None]:
+    """
+    Формирует страницу /deals по последнему оценённому снимку конвейера с учётом
+    диапазона цен и минимальной прибыли пользователя. Запросов к tonnel не делает.
+    """
+    current_settings = get_user_actual_settings(user_id)
+    found = scan_pipeline.deals.query(current_settings['min_profit'], current_settings['price_range'],
+                                      current_settings.get('assets'))
+    found = [lot for lot in found if watchlists.allows(user_id, lot)]
+    age = time.time() - auction_snapshot['fetched_at']
+
+    if not found:
+        return (f"Сейчас нет аукционов с прибылью от {current_settings['min_profit']}% "
+                f"в диапазоне {current_settings['price_range'][0]}-{current_settings['price_range'][1]} TON.\n"
+                f"Данные обновлены {age:.0f} сек. назад."), None
+
+    pages = (len(found) + config.DEALS_PAGE_SIZE - 1) // config.DEALS_PAGE_SIZE
+    page = min(max(page, 0), pages - 1)
+    start = page * config.DEALS_PAGE_SIZE
+    entries = [scanner.format_lot_short(lot) for lot in found[start:start + config.DEALS_PAGE_SIZE]]
+    text = (
+        f"💎 Выгодные аукционы: {len(found)} (страница {page + 1}/{pages})\n"
+        f"Данные обновлены {age:.0f} сек. назад.\n\n" + "\n\n".join(entries)
+    )
+
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"deals_page_{page - 1}"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f"deals_page_{page + 1}"))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return text, keyboard
+
+@dp.message(Command("deals"))
+async def deals_command(message: types.Message):
+    """
+    Обработчик команды /deals. Показывает выгодные аукционы из последнего снимка сканера.
+    """
+    user_id = message.from_user.id
+    if not await check_subscription_status(user_id, message):
+        return
+
+    text, keyboard = build_deals_page(user_id, 0)
+    await message.reply(text, reply_markup=keyboard, disable_web_page_preview=True)
+    logger.info("Пользователь %s запросил /deals", user_id)
+
+@dp.callback_query(F.data.startswith("deals_page_"))
+async def deals_page_callback(callback_query: types.CallbackQuery):
+    """
+    Обработчик кнопок листания /deals.
+    """
+    user_id = callback_query.from_user.id
+    if not await check_subscription_status(user_id, callback_query):
+        return
+
+    await callback_query.answer()
+    try:
+        page = int(callback_query.data.rsplit('_', 1)[1])
+    except ValueError:
+        logger.error("Неверный формат callback_data: %s", callback_query.data)
+        return
+
+    text, keyboard = build_deals_page(user_id, page)
+    try:
+        await callback_query.message.edit_text(text, reply_markup=keyboard, disable_web_page_preview=True)
+    except TelegramBadRequest as e:
+        # Например, страница не изменилась с прошлого нажатия
+        logger.debug("Не удалось обновить страницу /deals для пользователя %s: %s", user_id, e)
+
+# --- Списки отслеживания и блокировки ---
+
+FILTER_LIST_TITLES = {
+    watchlist.WATCH: "отслеживания",
+    watchlist.BLOCK: "блокировки",
+}
+
+def parse_filter_entry(text: str) -> tuple[str, str, str] | None:
+    """
+    Разбирает запись списка: "Название", "Название | Модель" или "backdrop Фон".
+    Возвращает (название, модель, фон) или None, если запись пустая.
+    """
+    text = text.strip()
+    if text.lower().startswith("backdrop "):
+        backdrop = text[len("backdrop "):].strip()
+        return ('', '', backdrop) if backdrop else None
+    name, _, model = text.partition('|')
+    name, model = name.strip(), model.strip()
+    return (name, model, '') if name else None
+
+def format_filter_entry(name: str, model: str, backdrop: str) -> str:
+    if backdrop:
+        return f"фон {backdrop}"
+    return f"{name} | {model}" if model else name
+
+async def edit_filter_list(message: types.Message, list_name: str, add: bool):
+    """Общий обработчик /watch, /unwatch, /block и /unblock."""
+    user_id = message.from_user.id
+    if not await check_subscription_status(user_id, message):
+        return
+
+    command, _, text = message.text.partition(' ')
+    title = FILTER_LIST_TITLES[list_name]
+    if not add and text.strip().lower() == "all":
+        removed = db.clear_user_filters(user_id, list_name)
+        if removed:
+            reload_watchlists()
+        await message.reply(f"Удалено записей из списка {title}: {removed}.")
+        return
+
+    entry = parse_filter_entry(text)
+    if entry is None:
+        await message.reply(
+            f"Пожалуйста, укажите запись. Примеры:\n"
+            f"{command} Plush Pepe — по названию\n"
+            f"{command} Plush Pepe | Cozy Galaxy — по названию и модели\n"
+            f"{command} backdrop Black — по фону"
+            + (f"\n{command} all — очистить список" if not add else "")
+        )
+        return
+
+    if add:
+        changed = db.add_user_filter(user_id, list_name, *entry)
+        result = f"добавлено в список {title}" if changed else f"уже есть в списке {title}"
+    else:
+        changed = db.remove_user_filter(user_id, list_name, *entry)
+        result = f"удалено из списка {title}" if changed else f"не найдено в списке {title}"
+    if changed:
+        reload_watchlists()
+    await message.reply(f"«{format_filter_entry(*entry)}» {result}.")
+    logger.info("Пользователь %s: %s %s", user_id, entry, result)
+
+@dp.message(Command("watch"))
+async def watch_command(message: types.Message):
+    """
+    Обработчик команды /watch. Добавляет название, модель или фон в список отслеживания:
+    если список не пуст, уведомления приходят только о лотах из него.
+    """
+    await edit_filter_list(message, watchlist.WATCH, add=True)
+
+@dp.message(Command("unwatch"))
+async def unwatch_command(message: types.Message):
+    """Обработчик команды /unwatch. Удаляет запись из списка отслеживания (all — очищает список)."""
+    await edit_filter_list(message, watchlist.WATCH, add=False)
+
+@dp.message(Command("block"))
+async def block_command(message: types.Message):
+    """Обработчик команды /block. Добавляет название, модель или фон в список блокировки."""
+    await edit_filter_list(message, watchlist.BLOCK, add=True)
+
+@dp.message(Command("unblock"))
+async def unblock_command(message: types.Message):
+    """Обработчик команды /unblock. Удаляет запись из списка блокировки (all — очищает список)."""
+    await edit_filter_list(message, watchlist.BLOCK, add=False)
+
+@dp.message(Command("lists"))
+async def lists_command(message: types.Message):
+    """
+    Обработчик команды /lists. Показывает списки отслеживания и блокировки пользователя.
+    """
+    user_id = message.from_user.id
+    if not await check_subscription_status(user_id, message):
+        return
+
+    entries = {watchlist.WATCH: [], watchlist.BLOCK: []}
+    for list_name, name, model, backdrop in db.get_user_filters(user_id):
+        entries.setdefault(list_name, []).append(format_filter_entry(name, model, backdrop))
+
+    lines = []
+    for list_name, title in FILTER_LIST_TITLES.items():
+        lines.append(f"Список {title}:")
+        if entries[list_name]:
+            lines.extend(f"• {entry}" for entry in entries[list_name])
+        else:
+            lines.append("пусто")
+    if not entries[watchlist.WATCH]:
+        lines.append("\nСписок отслеживания пуст — приходят уведомления обо всех подходящих лотах.")
+    lines.append("\nИзменить: /watch, /unwatch, /block, /unblock")
+    await message.reply("\n".join(lines))
+
 # --- Функции оплаты и подписок (Aiogram) ---
 
 @dp.message(Command("subscribe"))
@@ -562,26 +926,203 @@ async def handle_payment_choice_callback(callback_query: types.CallbackQuery):
         ])
         await callback_query.message.edit_text("Выберите период подписки (CryptoBot):", reply_markup=keyboard)
 
+def parse_give_period(value: str) -> int | None:
+    """Период для /give: ключ SUBSCRIPTION_DURATIONS (24h, 7days, 1month) или число дней вида 3d. None, если не распознан."""
+    if value in config.SUBSCRIPTION_DURATIONS:
+        return config.SUBSCRIPTION_DURATIONS[value]
+    if value.endswith('d') and value[:-1].isdigit() and int(value[:-1]) > 0:
+        return int(value[:-1]) * 86400
+    return None
+
+def resolve_give_targets(entries: list) -> tuple[list, list]:
+    """
+    Разбирает получателей /give: числовой ID или @username. ID и username проверяются в БД пакетно:
+    подписку получают только пользователи, которые уже писали боту.
+    Возвращает (список user_id, список записей, не найденных в базе).
+    """
+    known_ids, found = db.resolve_users(
+        [int(entry) for entry in entries if entry.isdigit()],
+        [entry.lstrip('@') for entry in entries if not entry.isdigit()]
+    )
+    user_ids = []
+    missing = []
+    for entry in entries:
+        if entry.isdigit():
+            user_id = int(entry) if int(entry) in known_ids else None
+        else:
+            user_id = found.get(entry.lstrip('@').lower())
+        if user_id is None:
+            missing.append(entry)
+        else:
+            user_ids.append(user_id)
+    return user_ids, missing
+
 @dp.message(Command("give"))
 async def give_command(message: types.Message):
+    """
+    Обработчик команды /give <период> <@username|ID> ... (только для админа). Продлевает подписку
+    сразу многим пользователям одной транзакцией. Получатели разделяются пробелами, запятыми или переводами строк.
+    """
     user_id = message.from_user.id
     if not db.is_admin(user_id):
         await message.reply("⛔ У вас нет прав для этой команды.")
         return
 
-    args = message.text.split()
-    if len(args) != 2 or not args[1].startswith("@"):
-        await message.reply("⚠️ Используйте формат: /give @username")
+    args = message.text.replace(',', ' ').split()[1:]
+    period_seconds = parse_give_period(args[0]) if args else None
+    if period_seconds is None or len(args) < 2:
+        await message.reply(
+            "⚠️ Используйте формат: /give <период> @username [ID ...]\n"
+            f"Период: {', '.join(config.SUBSCRIPTION_DURATIONS)} или число дней, например 3d."
+        )
         return
 
-    username = args[1][1:]
-    tg_id = db.get_user_id_by_username(username)
-    if not tg_id:
-        await message.reply("❌ Пользователь не найден в базе.")
+    user_ids, missing = resolve_give_targets(args[1:])
+    end_dates = extend_subscriptions(user_ids, period_seconds) if user_ids else {}
+
+    lines = [f"✅ Подписка продлена на {period_seconds / 86400:g} дн. для {len(end_dates)} пользователей."]
+    if len(end_dates) == 1:
+        (tg_id, end_date), = end_dates.items()
+        lines.append(f"ID: {tg_id}, действительна до: {time.ctime(end_date)}")
+    if missing:
+        shown = ", ".join(missing[:20])
+        more = f" и ещё {len(missing) - 20}" if len(missing) > 20 else ""
+        lines.append(f"❌ Не найдены в базе ({len(missing)}): {shown}{more}")
+    await message.reply("\n".join(lines))
+    logger.info("Админ %s выдал подписку на %.0f сек.: продлено %d, не найдено %d",
+                user_id, period_seconds, len(end_dates), len(missing))
+
+
+@dp.message(Command("history"))
+async def history_command(message: types.Message):
+    """
+    Обработчик команды /history [дни]. Показывает последние уведомления пользователя за указанное
+    число дней (по умолчанию 7).
+    """
+    user_id = message.from_user.id
+    if not await check_subscription_status(user_id, message):
         return
 
-    await message.reply(f"✅ Команда /give успешно применена к пользователю @{username} (ID: {tg_id}).")
-    # Здесь можешь выдать подписку, активировать доступ и т.п.
+    args = message.text.split()[1:]
+    try:
+        days = int(args[0]) if args else 7
+        if days <= 0:
+            raise ValueError
+    except ValueError:
+        await message.reply("Пожалуйста, укажите число дней (положительное целое). Пример: /history 7")
+        return
+
+    rows = db.get_user_alerts(user_id, time.time() - days * 86400, config.HISTORY_PAGE_SIZE)
+    if not rows:
+        await message.reply(f"За последние {days} дн. уведомлений не было.")
+        return
+
+    lines = [f"🗂 Последние уведомления за {days} дн.:"]
+    for gift_id, name, model, asset, bid, floor, percent, ts in rows:
+        lines.append(
+            f"{time.strftime('%d.%m %H:%M', time.localtime(ts))} {name} | {model}: "
+            f"{bid:.2f} → {floor:.2f} {asset} ({percent:+.1f}%)"
+        )
+    await message.reply("\n".join(lines))
+
+def format_model_alerts(name: str, model: str, hours: int, rows: list) -> str:
+    """Текст /alertstats по одной модели: итоги и последние HISTORY_PAGE_SIZE уведомлений."""
+    if not rows:
+        return f"Уведомлений по {name} | {model} за {hours} ч. не было."
+    users = {row[0] for row in rows}
+    avg_percent = sum(row[5] for row in rows) / len(rows)
+    lines = [f"{name} | {model} за {hours} ч.: уведомлений {len(rows)} (пользователей {len(users)}), "
+             f"средняя прибыль {avg_percent:.1f}%"]
+    for user_id, gift_id, asset, bid, floor, percent, ts in rows[-config.HISTORY_PAGE_SIZE:]:
+        lines.append(f"{time.strftime('%d.%m %H:%M', time.localtime(ts))} #{gift_id} → {user_id}: "
+                     f"{bid:.2f} → {floor:.2f} {asset} ({percent:+.1f}%)")
+    return "\n".join(lines)
+
+@dp.message(Command("alertstats"))
+async def alert_stats_command(message: types.Message):
+    """
+    Обработчик команды /alertstats [часы] [название | модель] (только для админа). Сводка по истории уведомлений
+    за указанное число часов (по умолчанию 24), а с названием и моделью — уведомления по этой модели.
+    """
+    if not db.is_admin(message.from_user.id):
+        await message.reply("⛔ У вас нет прав для этой команды.")
+        return
+
+    args = message.text.partition(' ')[2].strip()
+    hours = 24
+    first, _, rest = args.partition(' ')
+    if first.isdigit():
+        hours, args = int(first), rest.strip()
+    since = time.time() - hours * 3600
+
+    if args:
+        name, _, model = (part.strip() for part in args.partition('|'))
+        if not name or not model:
+            await message.reply("Пожалуйста, укажите число часов и/или модель. Пример: /alertstats 24 Plush Pepe | Cozy")
+            return
+        await message.reply(format_model_alerts(name, model, hours, db.get_model_alerts(name, model, since)))
+        return
+
+    summary = db.get_alerts_summary(since)
+    lines = [
+        f"Уведомления за {hours} ч.: {summary['total']} (пользователей {summary['users']}, лотов {summary['gifts']}), "
+        f"средняя прибыль {summary['avg_percent']:.1f}%",
+        f"Ожидают записи в БД: {len(alert_history)}",
+    ]
+    if summary['top_models']:
+        lines.append("Чаще всего:")
+        for name, model, count, avg_percent in summary['top_models']:
+            lines.append(f"{name} | {model}: {count} (в среднем {avg_percent:.1f}%)")
+    await message.reply("\n".join(lines))
+
+@dp.message(Command("pipeline"))
+async def pipeline_command(message: types.Message):
+    """
+    Обработчик команды /pipeline (только для админа). Показывает состояние очередей конвейера сканирования.
+    """
+    if not db.is_admin(message.from_user.id):
+        await message.reply("⛔ У вас нет прав для этой команды.")
+        return
+
+    lines = ["Конвейер сканирования (стадия: в очереди / макс. за тик / обработано / воркеров):"]
+    depths = scan_pipeline.queue_depths()
+    for stage in pipeline.STAGES:
+        lines.append(
+            f"{stage}: {depths.get(stage, 0)} / {scan_pipeline.max_depth[stage]} / "
+            f"{scan_pipeline.processed[stage]} / {scan_pipeline.workers[stage]}"
+        )
+    await message.reply("\n".join(lines))
+
+
+@dp.message(Command("latency"))
+async def latency_command(message: types.Message):
+    """
+    Обработчик команды /latency (только для админа). Показывает, сколько времени занимает каждый отрезок
+    пути лота от появления в снимке до доставки уведомления, по последним замерам.
+    """
+    if not db.is_admin(message.from_user.id):
+        await message.reply("⛔ У вас нет прав для этой команды.")
+        return
+
+    summary = latency_tracer.summary() if latency_tracer else {}
+    if not summary:
+        await message.reply("Замеров задержки пока нет.")
+        return
+
+    titles = {
+        'page_gifts': "запрос pageGifts",
+        'filter_stats': "запрос filterStats",
+        'floor': "появление → оценка",
+        'match': "оценка → совпадение",
+        'deliver': "совпадение → доставка",
+        'total': "появление → доставка",
+    }
+    lines = ["Задержка уведомлений, сек. (замеров / p50 / p95 / макс):"]
+    for span in tracing.SPANS:
+        if span in summary:
+            count, p50, p95, longest = summary[span]
+            lines.append(f"{titles[span]}: {count} / {p50:.2f} / {p95:.2f} / {longest:.2f}")
+    await message.reply("\n".join(lines))
 
 
 @dp.callback_query(F.data.startswith("sub_"))
@@ -673,28 +1214,10 @@ async def successful_payment_callback(message: types.Message):
     if len(payload_parts) == 4 and payload_parts[3] == "invoice" and payload_parts[2] == "stars":
         period = payload_parts[1]
         
-        duration_seconds = 0
-        if period == "24h":
-            duration_seconds = 24 * 3600
-        elif period == "7days":
-            duration_seconds = 7 * 24 * 3600
-        elif period == "1month":
-            duration_seconds = 30 * 24 * 3600
-
-        current_end_date = db.get_subscription_end_date(user_id)
-        if current_end_date > time.time():
-            new_end_date = current_end_date + duration_seconds
-        else:
-            new_end_date = time.time() + duration_seconds
-
-        db.set_subscription_end_date(user_id, new_end_date)
+        # Продление и активация пользователя — одна транзакция в БД, кэш обновляется там же
+        new_end_date = extend_subscriptions([user_id], config.SUBSCRIPTION_DURATIONS[period])[user_id]
         period_name_ru = config.SUBSCRIPTION_PRICES[period]["name_ru"]
 
-        # Активируем пользователя в кэше и БД
-        user_prefs = get_user_actual_settings(user_id)
-        user_prefs['active'] = True
-        db.set_user_prefs(user_id, user_prefs['min_profit'], user_prefs['interval'], user_prefs['price_range'][0], user_prefs['price_range'][1], True)
-
         await message.reply(
             f"🎉 Поздравляем! Ваша подписка на {period_name_ru} успешно активирована.\n"
             f"Действительна до: {time.ctime(new_end_date)}\n"
@@ -802,28 +1325,10 @@ async def check_cryptobot_invoice_status(user_id: int, invoice_id: str, period:
             if invoice_status_data.get("ok") and invoice_status_data["result"] and invoice_status_data["result"]["items"]:
                 invoice = invoice_status_data["result"]["items"][0]
                 if invoice["status"] == "paid":
-                    duration_seconds = 0
-                    if period == "24h":
-                        duration_seconds = 24 * 3600
-                    elif period == "7days":
-                        duration_seconds = 7 * 24 * 3600
-                    elif period == "1month":
-                        duration_seconds = 30 * 24 * 3600
-
-                    current_end_date = db.get_subscription_end_date(user_id)
-                    if current_end_date > time.time():
-                        new_end_date = current_end_date + duration_seconds
-                    else:
-                        new_end_date = time.time() + duration_seconds
-
-                    db.set_subscription_end_date(user_id, new_end_date)
+                    # Продление и активация пользователя — одна транзакция в БД, кэш обновляется там же
+                    new_end_date = extend_subscriptions([user_id], config.SUBSCRIPTION_DURATIONS[period])[user_id]
                     period_name_ru = config.SUBSCRIPTION_PRICES[period]["name_ru"]
 
-                    # Активируем пользователя в кэше и БД
-                    user_prefs = get_user_actual_settings(user_id)
-                    user_prefs['active'] = True
-                    db.set_user_prefs(user_id, user_prefs['min_profit'], user_prefs['interval'], user_prefs['price_range'][0], user_prefs['price_range'][1], True)
-
                     await bot.send_message(
                         chat_id=user_id,
                         text=(
@@ -862,11 +1367,35 @@ async def main():
     Основная функция, запускающая Telegram-бота.
     """
     global bot_username # Объявляем, что будем использовать глобальную переменную
-    
+    global decode_executor
+    global scan_pipeline
+    global deals_api
+    global auction_recorder
+    global latency_tracer
+
+    # Процесс пула запускается через forkserver, а не fork: к первому submit в процессе уже работают потоки
+    # (трассировка, asyncio.to_thread, aiohttp), а fork процесса с потоками небезопасен.
+    # Процесс пула импортирует этот модуль заново, поэтому всё, что открывает файлы или запускает потоки,
+    # создаётся здесь, а не на уровне модуля.
+    decode_executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=1, mp_context=multiprocessing.get_context("forkserver")
+    )
+    latency_tracer = tracing.LatencyTracer()
+    tonnel_client.on_request = latency_tracer.record_request
+    if config.RECORD_PATH:
+        auction_recorder = recorder.AuctionRecorder(config.RECORD_PATH)
+
+    for asset in config.SCAN_ASSETS:
+        if asset not in scan_assets:
+            logger.warning("Валюта %s не сканируется: floor-цены известны только в TON, а курса в ASSET_PER_TON нет", asset)
+
     db.init_db()
     db.set_admin_status(config.TELEGRAM_USER_ID, True)
     logger.info("Администратор %s установлен в базе данных.", config.TELEGRAM_USER_ID)
 
+    # Статусы админов и даты подписок читаются командами из кэша в памяти
+    db.warm_subscription_cache()
+
     # Получаем username бота при запуске
     try:
         me = await bot.get_me()
@@ -878,6 +1407,19 @@ async def main():
         import sys
         sys.exit(1) # Выход с ошибкой
 
+    # Загружаем даты окончания подписок один раз, дальше их обновляют обработчики оплаты
+    expiry_scheduler.load(db.get_all_subscription_end_dates())
+
+    # Восстанавливаем состояние сканера до первого тика и включаем периодическое сохранение
+    restore_scanner_state()
+    reload_watchlists()
+    scheduler.add_job(
+        save_scanner_state,
+        IntervalTrigger(seconds=config.CHECKPOINT_INTERVAL),
+        id="save_scanner_state",
+        misfire_grace_time=30
+    )
+
     # Запускаем APScheduler
     scheduler.start()
     logger.info("APScheduler запущен.")
@@ -886,10 +1428,30 @@ async def main():
     try:
         # Запускаем фоновую задачу проверки аукционов как часть loop'а диспетчера
         # Она сама управляет своим интервалом через asyncio.sleep
+        scan_pipeline = pipeline.ScanPipeline(get_floor_price, bot.send_message, tracker=bid_tracker,
+                                              on_delivered=alert_history.add, tracer=latency_tracer,
+                                              filters=watchlists, settings=user_settings,
+                                              get_fetched_at=lambda: auction_snapshot['fetched_at'])
+        scan_pipeline.start()
+        asyncio.create_task(alert_history.run())
         asyncio.create_task(check_auctions_job())
+        if config.API_ENABLED:
+            deals_api = api.DealsApi(lambda: scan_pipeline.deals, lambda: auction_snapshot['fetched_at'])
+            await deals_api.start()
+        asyncio.create_task(expiry_scheduler.run(expire_subscription))
         await dp.start_polling(bot) # Запускает опрос обновлений от Telegram
     finally:
-        # Закрытие сессии бота и остановка планировщика при завершении работы
+        # Сохраняем состояние сканера, закрываем сессию бота и останавливаем планировщик при завершении работы
+        await save_scanner_state()
+        if auction_recorder:
+            auction_recorder.close()
+        if deals_api:
+            await deals_api.stop()
+        await scan_pipeline.stop()
+        await alert_history.flush()
+        latency_tracer.close()
+        await tonnel_client.close()
+        decode_executor.shutdown(wait=False, cancel_futures=True)
         await bot.session.close()
         scheduler.shutdown()
         logger.info("Бот остановлен. APScheduler остановлен.")
@@ -0,0 +1,87 @@
+import logging
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class AuctionStats:
+    """Накопленная статистика ставок одного аукциона между снимками pageGifts."""
+
+    __slots__ = ('bid_count', 'bid', 'observed_at', 'bid_rate', 'price_rate', 'rated', 'tick')
+
+    def __init__(self, bid_count: int, bid: float, observed_at: float, tick: int):
+        self.bid_count = bid_count
+        self.bid = bid
+        self.observed_at = observed_at
+        self.bid_rate = 0.0 # Ставок в секунду (скользящее среднее)
+        self.price_rate = 0.0 # Рост ставки в TON в секунду (скользящее среднее)
+        self.rated = False # Есть ли хотя бы один замер скорости (лот встречен минимум в двух снимках)
+        self.tick = tick
+
+
+class BidTracker:
+    """
+    Инкрементальная аналитика ставок по активным аукционам. На каждом снимке для лота берутся только
+    количество ставок (len(bidHistory)) и последняя ставка, поэтому обновление — O(1) без повторного
+    прохода по истории. Скорость ставок и рост цены сглаживаются экспоненциальным скользящим средним,
+    прогноз итоговой ставки — линейная экстраполяция роста цены до конца аукциона
+    (не дальше BID_PROJECTION_HORIZON секунд). Скорость можно измерить только между двумя снимками,
+    поэтому при первой встрече лота прогноза нет (projected_bid = None).
+    """
+
+    def __init__(self, smoothing: float | None = None, horizon: float | None = None):
+        self.smoothing = smoothing if smoothing is not None else config.BID_RATE_SMOOTHING
+        self.horizon = horizon if horizon is not None else config.BID_PROJECTION_HORIZON
+        self.stats = {}
+        self._tick = 0
+
+    def start_tick(self):
+        """Начинает новый снимок: аукционы, не встреченные в нём, будут удалены в end_tick()."""
+        self._tick += 1
+
+    def end_tick(self):
+        """Удаляет статистику аукционов, которых не было в последнем снимке (завершились или сняты)."""
+        finished = [gift_id for gift_id, stats in self.stats.items() if stats.tick != self._tick]
+        for gift_id in finished:
+            del self.stats[gift_id]
+        if finished:
+            logger.debug("Аналитика ставок: завершено аукционов %d, отслеживается %d", len(finished), len(self.stats))
+
+    def observe(self, lot: dict, now: float):
+        """
+        Учитывает лот из текущего снимка и дополняет его полями bid_rate (ставок в минуту)
+        и projected_bid (прогноз итоговой ставки в TON; None, пока скорость ещё не измерена).
+        """
+        gift_id = lot['gift_id']
+        stats = self.stats.get(gift_id)
+        if stats is None:
+            stats = self.stats[gift_id] = AuctionStats(lot['bid_count'], lot['bid'], now, self._tick)
+        else:
+            elapsed = now - stats.observed_at
+            if elapsed > 0:
+                bid_rate = max(0, lot['bid_count'] - stats.bid_count) / elapsed
+                price_rate = max(0.0, lot['bid'] - stats.bid) / elapsed
+                if stats.rated:
+                    alpha = self.smoothing
+                    stats.bid_rate += alpha * (bid_rate - stats.bid_rate)
+                    stats.price_rate += alpha * (price_rate - stats.price_rate)
+                else:
+                    # Первый замер задаёт начальное значение среднего, а не усредняется с нулём
+                    stats.bid_rate, stats.price_rate, stats.rated = bid_rate, price_rate, True
+                stats.bid_count = lot['bid_count']
+                stats.bid = lot['bid']
+                stats.observed_at = now
+            stats.tick = self._tick
+
+        lot['bid_rate'] = stats.bid_rate * 60
+        if not stats.rated:
+            lot['projected_bid'] = None
+            return
+        remaining = self.horizon
+        if lot.get('end_ts') is not None:
+            remaining = min(remaining, max(0.0, lot['end_ts'] - now))
+        lot['projected_bid'] = lot['bid'] + stats.price_rate * remaining
+
+    def __len__(self):
+        return len(self.stats)
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import logging
+import time
+
+from aiohttp import web
+
+import config
+import scanner
+
+logger = logging.getLogger(__name__)
+
+# Поля лота, которые отдаёт API (остальное — служебные данные конвейера)
+LOT_FIELDS = ('gift_id', 'gift_num', 'name', 'model', 'backdrop', 'asset', 'bid', 'bid_count', 'end_time',
+              'floor', 'floor_level', 'profit', 'percent', 'projected_bid', 'projected_percent')
+
+
+class DealsApi:
+    """
+    Встроенный HTTP API только для чтения: GET /deals отдаёт последний оценённый снимок конвейера
+    (deals.DealIndex) в JSON, чтобы дашборды и другие боты не опрашивали tonnel сами.
+    Параметры: min_profit, min_price, max_price, asset (через запятую), limit.
+    ETag зависит от снимка и параметров, поэтому повторный запрос с If-None-Match до следующего тика
+    получает 304 без тела.
+    """
+
+    def __init__(self, get_deals, get_fetched_at, host: str | None = None, port: int | None = None):
+        self.get_deals = get_deals
+        self.get_fetched_at = get_fetched_at
+        self.host = host or config.API_HOST
+        self.port = port or config.API_PORT
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/deals', self.handle_deals)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info("HTTP API снимка выгодных лотов запущен на http://%s:%d/deals", self.host, self.port)
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @staticmethod
+    def _parse_query(query) -> dict:
+        """Разбирает параметры запроса. Бросает ValueError при неверном значении."""
+        assets = tuple(sorted({asset.strip().upper() for asset in query.get('asset', '').split(',') if asset.strip()}))
+        params = {
+            'min_profit': float(query.get('min_profit', '-inf')),
+            'min_price': float(query.get('min_price', '0')),
+            'max_price': float(query.get('max_price', 'inf')),
+            'assets': assets,
+            'limit': int(query.get('limit', config.API_MAX_LOTS)),
+        }
+        if params['limit'] <= 0:
+            raise ValueError("limit должен быть положительным")
+        params['limit'] = min(params['limit'], config.API_MAX_LOTS)
+        return params
+
+    async def handle_deals(self, request: web.Request) -> web.Response:
+        try:
+            params = self._parse_query(request.query)
+        except ValueError as e:
+            return web.json_response({'error': f"Неверные параметры запроса: {e}"}, status=400)
+
+        deals = self.get_deals()
+        if deals is None:
+            return web.json_response({'error': "Сканер ещё не запущен"}, status=503)
+
+        # Снимок неизменяем до следующего тика, поэтому ETag = время оценки снимка + параметры
+        key = f"{deals.evaluated_at!r}|{sorted(params.items())!r}"
+        etag = f'"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            return web.Response(status=304, headers={'ETag': etag})
+
+        lots = deals.query(params['min_profit'], (params['min_price'], params['max_price']), params['assets'])
+        fetched_at = self.get_fetched_at()
+        body = {
+            'evaluated_at': deals.evaluated_at,
+            'fetched_at': fetched_at,
+            'age': round(time.time() - fetched_at, 1) if fetched_at else None,
+            'total': len(lots),
+            'lots': [
+                dict({field: lot.get(field) for field in LOT_FIELDS}, link=scanner.gift_link(lot))
+                for lot in lots[:params['limit']]
+            ],
+        }
+        return web.Response(
+            text=json.dumps(body, ensure_ascii=False),
+            content_type='application/json',
+            headers={'ETag': etag, 'Cache-Control': 'no-cache'},
+        )
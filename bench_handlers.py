@@ -0,0 +1,313 @@
+"""
+Нагрузочный замер обработчиков команд бота.
+
+Синтетические Update (/settings, /setprofit, колбэки choose_payment_* и т.д.) подаются напрямую
+в dp.feed_update. Вместо Telegram API используется заглушка сессии бота, вместо рабочей базы —
+временная SQLite. По желанию параллельно крутится цикл сканирования (check_auctions_job) на синтетических
+ответах tonnel, чтобы увидеть, как он влияет на задержки команд и конкуренцию за базу.
+
+Для каждого обработчика выводятся перцентили задержки и время, проведённое в функциях db.
+
+Примеры:
+    python bench_handlers.py
+    python bench_handlers.py --updates 5000 --concurrency 100 --with-scan
+    python bench_handlers.py --handlers /settings choose_payment_stars --api-latency 0.05
+"""
+import argparse
+import asyncio
+import contextvars
+import datetime
+import functools
+import importlib
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from aiogram import types
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import AnswerCallbackQuery, GetMe
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Набор по умолчанию: команды и колбэки, которые не меняют статус активности пользователя,
+# чтобы цикл сканирования видел одинаковый набор пользователей на протяжении замера
+DEFAULT_HANDLERS = [
+    "/settings",
+    "/setprofit 7",
+    "/setpricerange 1 50",
+    "/digest off",
+    "/deals",
+    "/subscribe",
+    "choose_payment_stars",
+    "choose_payment_cryptobot",
+    "deals_page_1",
+]
+
+# Время в функциях db, накопленное текущим обновлением (или циклом сканирования)
+_db_time = contextvars.ContextVar("db_time")
+# Признак того, что выполнение уже внутри функции db (например, get_user_prefs вызывает set_user_prefs)
+_db_nested = contextvars.ContextVar("db_nested", default=False)
+
+
+class StubSession(BaseSession):
+    """
+    Заглушка сессии aiogram: вместо запроса к Telegram возвращает правдоподобный результат метода
+    после необязательной задержки, имитирующей сетевой round-trip.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.requests = 0
+        self._message_ids = itertools.count(1)
+
+    async def close(self):
+        pass
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if isinstance(method, GetMe):
+            return types.User(id=bot.id, is_bot=True, first_name="bench", username="bench_bot")
+        if isinstance(method, AnswerCallbackQuery):
+            return True
+        chat_id = getattr(method, "chat_id", None)
+        return types.Message(
+            message_id=next(self._message_ids),
+            date=datetime.datetime.now(),
+            chat=types.Chat(id=int(chat_id) if isinstance(chat_id, (int, str)) else 0, type="private"),
+            text=getattr(method, "text", None),
+        )
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+
+class FakeResponse:
+    """Ответ tonnel с теми атрибутами, которые читает бот."""
+
+    def __init__(self, body: bytes):
+        self.status_code = 200
+        self.content = body
+        self.text = body.decode()
+        self.headers = {}
+
+
+class SyntheticTonnel:
+    """Генерирует ответы pageGifts с новыми gift_id на каждом запросе и фиксированный filterStats."""
+
+    def __init__(self, lots: int, names: int = 20, models: int = 10):
+        self.lots = lots
+        self.keys = [(f"Gift{n}", f"Model{m}") for n in range(names) for m in range(models)]
+        self.floors = {key: round(random.uniform(2, 60), 2) for key in self.keys}
+        self._gift_ids = itertools.count(1)
+
+    async def fetch_page_gifts(self, asset="TON"):
+        auctions = []
+        for _ in range(self.lots):
+            gift_id = next(self._gift_ids)
+            name, model = random.choice(self.keys)
+            bid = self.floors[(name, model)] * random.uniform(0.5, 1.2)
+            auctions.append({
+                "gift_id": gift_id,
+                "gift_num": gift_id,
+                "name": name,
+                "model": model,
+                "backdrop": "Black",
+                "asset": asset,
+                "auction": {
+                    "auctionEndTime": "2030-01-01T00:00:00.000Z",
+                    "bidHistory": [{"amount": round(bid, 2)}],
+                },
+            })
+        return FakeResponse(json.dumps(auctions).encode())
+
+    async def fetch_filter_stats(self, etag=None, last_modified=None):
+        data = {f"{name}_{model}": {"floorPrice": price} for (name, model), price in self.floors.items()}
+        return FakeResponse(json.dumps({"data": data}).encode())
+
+
+def instrument_db(db_module):
+    """
+    Оборачивает функции модуля db, чтобы считать время, проведённое в базе.
+    Прямые запросы к sqlite3 в 4.py (выборка пользователей в check_auctions_job) сюда не попадают.
+    """
+
+    def timed(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _db_nested.get():
+                return func(*args, **kwargs)
+            token = _db_nested.set(True)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _db_nested.reset(token)
+                spent = _db_time.get(None)
+                if spent is not None:
+                    spent[0] += time.perf_counter() - started
+        return wrapper
+
+    for name in dir(db_module):
+        value = getattr(db_module, name)
+        if callable(value) and not name.startswith("_") and getattr(value, "__module__", None) == db_module.__name__:
+            setattr(db_module, name, timed(value))
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_update(update_id: int, user_id: int, command: str) -> types.Update:
+    """Строит Update с сообщением (для команд, начинающихся с /) или с нажатием inline-кнопки."""
+    user = types.User(id=user_id, is_bot=False, first_name=f"user{user_id}", username=f"user{user_id}")
+    chat = types.Chat(id=user_id, type="private")
+    now = datetime.datetime.now()
+    if command.startswith("/"):
+        message = types.Message(message_id=update_id, date=now, chat=chat, from_user=user, text=command)
+        return types.Update(update_id=update_id, message=message)
+    message = types.Message(message_id=update_id, date=now, chat=chat, text="bench")
+    callback_query = types.CallbackQuery(id=str(update_id), from_user=user, chat_instance=str(user_id),
+                                         message=message, data=command)
+    return types.Update(update_id=update_id, callback_query=callback_query)
+
+
+async def run_bench(bot_module, db_module, args) -> dict:
+    """
+    Прогоняет args.updates обновлений через диспетчер: args.concurrency воркеров берут обновления
+    из общей очереди, как при polling с обработкой обновлений в отдельных задачах.
+    """
+    bot, dp = bot_module.bot, bot_module.dp
+    bot.session = StubSession(args.api_latency)
+
+    db_module.init_db()
+    db_module.set_admin_status(config.TELEGRAM_USER_ID, True)
+    now = time.time()
+    user_ids = [1_000_000 + index for index in range(args.users)]
+    for index, user_id in enumerate(user_ids):
+        db_module.save_user(user_id, f"user{user_id}")
+        db_module.set_user_prefs(user_id, config.DEFAULT_MIN_PROFIT, args.scan_interval, 0.0, 100.0, True)
+        if index < args.users * args.subscribed:
+            db_module.set_subscription_end_date(user_id, now + 86400)
+    db_module.warm_subscription_cache()
+    bot_module.expiry_scheduler.load(db_module.get_all_subscription_end_dates())
+    bot_module.bot_username = "bench_bot"
+
+    # Конвейер нужен и без цикла сканирования: /deals и deals_page_* читают его снимок (без --with-scan — пустой)
+    bot_module.scan_pipeline = bot_module.pipeline.ScanPipeline(bot_module.get_floor_price, bot.send_message,
+                                                                tracker=bot_module.bid_tracker,
+                                                                filters=bot_module.watchlists,
+                                                                settings=bot_module.user_settings)
+    scan_task = None
+    if args.with_scan:
+        synthetic = SyntheticTonnel(args.lots)
+        bot_module.tonnel_client.fetch_page_gifts = synthetic.fetch_page_gifts
+        bot_module.tonnel_client.fetch_filter_stats = synthetic.fetch_filter_stats
+        bot_module.scan_pipeline.start()
+        scan_db_time = [0.0]
+
+        async def scan_loop():
+            _db_time.set(scan_db_time)
+            await bot_module.check_auctions_job()
+
+        scan_task = asyncio.create_task(scan_loop())
+
+    queue = asyncio.Queue()
+    for update_id in range(1, args.updates + 1):
+        command = args.handlers[(update_id - 1) % len(args.handlers)]
+        queue.put_nowait((command, make_update(update_id, random.choice(user_ids), command)))
+
+    results = {command: {'latency': [], 'db': [], 'errors': 0} for command in args.handlers}
+
+    async def worker():
+        while not queue.empty():
+            command, update = queue.get_nowait()
+            spent = [0.0]
+            _db_time.set(spent)
+            started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                results[command]['errors'] += 1
+                logger.warning("Ошибка обработчика %s: %s", command, e)
+            results[command]['latency'].append(time.perf_counter() - started)
+            results[command]['db'].append(spent[0])
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(asyncio.create_task(worker()) for _ in range(args.concurrency)))
+    wall_time = time.perf_counter() - started_at
+
+    stats = {'wall_time': wall_time, 'handlers': results, 'api_requests': bot.session.requests}
+    if scan_task:
+        scan_task.cancel()
+        await asyncio.gather(scan_task, return_exceptions=True)
+        stats['scan'] = {'processed': dict(bot_module.scan_pipeline.processed), 'db_time': scan_db_time[0]}
+        await bot_module.scan_pipeline.stop()
+    return stats
+
+
+def print_report(stats: dict, total: int):
+    print(f"Обновлений: {total} за {stats['wall_time']:.3f} сек. ({total / stats['wall_time']:.0f} обновлений/сек.), "
+          f"запросов к Bot API: {stats['api_requests']}")
+    print(f"{'обработчик':<28}{'кол-во':>8}{'p50 мс':>10}{'p95 мс':>10}{'p99 мс':>10}{'макс мс':>10}{'БД ср. мс':>11}{'БД доля':>9}{'ошибки':>8}")
+    for command, result in stats['handlers'].items():
+        latency = sorted(result['latency'])
+        if not latency:
+            continue
+        total_latency = sum(latency)
+        total_db = sum(result['db'])
+        print(f"{command:<28}{len(latency):>8}"
+              f"{percentile(latency, 50) * 1000:>10.2f}{percentile(latency, 95) * 1000:>10.2f}"
+              f"{percentile(latency, 99) * 1000:>10.2f}{latency[-1] * 1000:>10.2f}"
+              f"{total_db / len(latency) * 1000:>11.3f}{total_db / total_latency if total_latency else 0:>9.1%}"
+              f"{result['errors']:>8}")
+    if 'scan' in stats:
+        print(f"Цикл сканирования: обработано по стадиям {stats['scan']['processed']}, "
+              f"время в БД {stats['scan']['db_time']:.3f} сек.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер задержки обработчиков команд через dp.feed_update.")
+    parser.add_argument("--updates", type=int, default=2000, help="Сколько обновлений отправить")
+    parser.add_argument("--concurrency", type=int, default=20, help="Сколько обновлений обрабатывается одновременно")
+    parser.add_argument("--users", type=int, default=200, help="Сколько синтетических пользователей завести в базе")
+    parser.add_argument("--subscribed", type=float, default=0.5, help="Доля пользователей с активной подпиской")
+    parser.add_argument("--handlers", nargs="+", default=DEFAULT_HANDLERS,
+                        help="Команды (/...) и данные колбэков, подаваемые по кругу")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Имитация задержки Bot API, сек.")
+    parser.add_argument("--with-scan", action="store_true", help="Параллельно запускать цикл сканирования аукционов")
+    parser.add_argument("--scan-interval", type=int, default=1, help="Интервал сканирования пользователей, сек.")
+    parser.add_argument("--lots", type=int, default=30, help="Аукционов в синтетическом ответе pageGifts")
+    parser.add_argument("--db", help="Путь к SQLite (по умолчанию — временный файл)")
+    args = parser.parse_args()
+
+    # Модуль db при импорте создаёт таблицу в текущем каталоге, поэтому работаем во временном
+    workdir = tempfile.mkdtemp(prefix="bench_handlers_")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+
+    db_module = importlib.import_module("db")
+    db_module.DATABASE_NAME = args.db or os.path.join(workdir, "bench.db")
+    instrument_db(db_module)
+    bot_module = importlib.import_module("4")
+    logging.getLogger().setLevel(logging.WARNING)
+
+    stats = asyncio.run(run_bench(bot_module, db_module, args))
+    print(f"База: {db_module.DATABASE_NAME}")
+    print_report(stats, args.updates)
+
+
+if __name__ == "__main__":
+    main()
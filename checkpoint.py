@@ -0,0 +1,53 @@
+import logging
+import os
+import pickle
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файла. Если формат поменяется, старые файлы просто игнорируются.
+CHECKPOINT_VERSION = 1
+
+
+def save_checkpoint(path: str, state: dict):
+    """
+    Сохраняет состояние сканера в компактный бинарный файл (pickle + zlib).
+    Запись атомарная: сначала во временный файл, затем os.replace,
+    чтобы падение во время записи не испортило предыдущую контрольную точку.
+    """
+    blob = zlib.compress(pickle.dumps({
+        'version': CHECKPOINT_VERSION,
+        'saved_at': time.time(),
+        'state': state,
+    }, protocol=pickle.HIGHEST_PROTOCOL))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    logger.debug("Состояние сканера сохранено в %s (%d байт)", path, len(blob))
+
+
+def load_checkpoint(path: str) -> dict | None:
+    """
+    Загружает состояние сканера из файла.
+    Возвращает None, если файла нет, он повреждён или записан другой версией формата.
+    """
+    try:
+        with open(path, 'rb') as f:
+            payload = pickle.loads(zlib.decompress(f.read()))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning("Не удалось прочитать контрольную точку %s: %s", path, e)
+        return None
+
+    if not isinstance(payload, dict) or payload.get('version') != CHECKPOINT_VERSION:
+        logger.warning("Контрольная точка %s имеет неподдерживаемый формат, пропускаем.", path)
+        return None
+
+    logger.info("Загружена контрольная точка %s (возраст %.0f сек.)", path, time.time() - payload['saved_at'])
+    return payload['state']
@@ -19,9 +19,76 @@ CRYPTOBOT_API_URL = "https://pay.crypt.bot/api"
 # --- Настройки по умолчанию и цены подписок ---
 DEFAULT_INTERVAL = 30 # Интервал проверки аукционов по умолчанию (в секундах)
 DEFAULT_MIN_PROFIT = 5 # Минимальный процент прибыли по умолчанию
+MAX_MIN_PROFIT = 100000 # Наибольший процент прибыли, который можно задать командой /setprofit
+MAX_INTERVAL = 86400 # Наибольший интервал проверки (в секундах), который можно задать командой /setinterval
 
 SUBSCRIPTION_PRICES = {
     "24h": {"stars": 15, "usd": 0.4, "name_ru": "24 часа"},
     "7days": {"stars": 80, "usd": 2.0, "name_ru": "7 дней"},
     "1month": {"stars": 350, "usd": 6.0, "name_ru": "1 месяц"}
-}
\ No newline at end of file
+}
+
+# --- Кэш floor-цен и контрольные точки состояния сканера ---
+FLOOR_CACHE_TTL = 60 # Сколько секунд считать ответ filterStats актуальным
+CHECKPOINT_PATH = "scanner_state.bin" # Файл с сохранённым состоянием сканера (кэш настроек, notified_ids, floor-цены, снимок аукционов)
+CHECKPOINT_INTERVAL = 60 # Как часто (в секундах) сохранять состояние сканера
+
+# --- Расчёт прибыли ---
+FLOOR_MARKUP = 1.06 # Наценка к floor-цене, по которой рассчитываем перепродажу
+SALE_COMMISSION_FACTOR = 0.9 # Доля, остающаяся после комиссии маркетплейса при продаже
+
+# --- Запись ответов tonnel для воспроизведения (replay.py) ---
+RECORD_PATH = None # Путь к журналу, например "tonnel_record.jsonl.gz". None — запись выключена
+RECORD_MAX_PENDING = 100 # Сколько ответов может ждать записи в журнал; при переполнении новые отбрасываются
+
+# --- Устойчивость запросов к tonnel ---
+TONNEL_TIMEOUT = 10 # Таймаут одного запроса (в секундах)
+TONNEL_MAX_RETRIES = 3 # Количество повторов при сетевой ошибке, 429 или 5xx
+TONNEL_BACKOFF_BASE = 0.5 # Базовая задержка перед повтором (удваивается с каждой попыткой, со случайным разбросом)
+TONNEL_BACKOFF_MAX = 10 # Максимальная задержка перед повтором
+TONNEL_BREAKER_THRESHOLD = 5 # После скольких неудачных запросов подряд приостанавливать обращения к tonnel
+TONNEL_BREAKER_RESET_TIMEOUT = 60 # На сколько секунд приостанавливать обращения к tonnel
+TONNEL_HEDGE_PAGE_GIFTS = True # Дублировать запрос pageGifts, если он отвечает дольше TONNEL_HEDGE_DELAY
+TONNEL_HEDGE_DELAY = 2.0 # Через сколько секунд без ответа отправлять дублирующий запрос
+
+# --- Разбор ответов filterStats ---
+JSON_OFFLOAD_THRESHOLD = 256 * 1024 # Ответы больше этого размера (в байтах) разбираются в отдельном процессе
+
+# --- Конвейер сканирования ---
+PIPELINE_QUEUE_SIZE = 100 # Максимальная длина очереди перед каждой стадией
+PIPELINE_WORKERS = {'parse': 1, 'enrich': 1, 'match': 1, 'deliver': 4} # Количество воркеров на стадию
+
+# --- Команда /deals ---
+DEALS_PAGE_SIZE = 5 # Количество аукционов на одной странице /deals
+
+# --- Аналитика ставок ---
+BID_RATE_SMOOTHING = 0.3 # Вес нового наблюдения в скользящем среднем скорости ставок (0..1)
+BID_PROJECTION_HORIZON = 600 # На сколько секунд вперёд (но не дальше окончания аукциона) экстраполировать рост ставки
+PROFIT_USE_PROJECTED_BID = False # Сравнивать с минимальной прибылью прогноз по итоговой ставке, а не по текущей
+
+# --- Сканируемые активы ---
+SCAN_ASSETS = ['TON'] # Валюты аукционов, которые сканируются параллельно, например ['TON', 'USDT']
+# filterStats отдаёт floor-цены в TON; для остальных валют они пересчитываются по курсу: сколько единиц валюты
+# стоит 1 TON, например {'USDT': 3.0}. Валюты из SCAN_ASSETS без курса при запуске отключаются
+ASSET_PER_TON = {}
+
+# --- История уведомлений ---
+HISTORY_BATCH_SIZE = 200 # Сколько уведомлений записывать в БД одной транзакцией
+HISTORY_FLUSH_INTERVAL = 5 # Как часто (в секундах) записывать накопленные уведомления в БД
+HISTORY_MAX_PENDING = 10000 # Максимум уведомлений, ожидающих записи; сверх него старые отбрасываются
+HISTORY_PAGE_SIZE = 10 # Сколько последних уведомлений показывает /history
+
+# --- Трассировка задержки уведомлений ---
+TRACE_PATH = "latency_trace.jsonl" # Файл трасс (JSON Lines с ротацией); None — только сводка в памяти
+TRACE_MAX_BYTES = 10 * 1024 * 1024 # Размер файла трасс, после которого он ротируется
+TRACE_BACKUP_COUNT = 3 # Сколько старых файлов трасс хранить
+TRACE_WINDOW = 1000 # Сколько последних замеров каждого отрезка хранить в памяти для /latency
+
+# --- HTTP API снимка выгодных лотов (для дашбордов и других ботов) ---
+API_ENABLED = False # Запускать встроенный HTTP API (GET /deals)
+API_HOST = "127.0.0.1" # Адрес, на котором слушает API
+API_PORT = 8080 # Порт API
+API_MAX_LOTS = 500 # Максимум лотов в одном ответе
+
+# --- Продление подписок ---
+SUBSCRIPTION_DURATIONS = {"24h": 24 * 3600, "7days": 7 * 24 * 3600, "1month": 30 * 24 * 3600} # Длительность периодов SUBSCRIPTION_PRICES в секундах
@@ -31,6 +31,15 @@ logger = logging.getLogger(__name__)
 
 DATABASE_NAME = 'bot_subscriptions.db'
 
+# Кэш статусов подписки в памяти процесса: user_id -> (is_admin, end_date).
+# Бот — единственный, кто пишет в таблицу subscriptions, поэтому кэш авторитетен:
+# запись сбрасывается функциями set_admin_status / set_subscription_end_date
+# и invalidate_subscription_cache, а команды читают статус без обращения к SQLite.
+_subscription_cache = {}
+
+# Сколько параметров подставлять в один запрос с IN (...) — с запасом ниже лимита SQLite на число переменных
+SQL_BATCH_SIZE = 500
+
 
 
 
@@ -52,7 +61,43 @@ def init_db():
             interval INTEGER DEFAULT 30,
             price_range_min REAL DEFAULT 5.0,
             price_range_max REAL DEFAULT 25.0,
-            active INTEGER DEFAULT 0 -- 1 если бот активен для пользователя, 0 если остановлен
+            active INTEGER DEFAULT 0, -- 1 если бот активен для пользователя, 0 если остановлен
+            digest INTEGER DEFAULT 0, -- 1 если уведомления за тик собираются в одно сообщение
+            assets TEXT DEFAULT NULL -- выбранные валюты через запятую, NULL — все сканируемые
+        )
+    ''')
+    # Миграция баз, созданных до появления новых колонок user_prefs
+    cursor.execute('PRAGMA table_info(user_prefs)')
+    prefs_columns = {row[1] for row in cursor.fetchall()}
+    if 'digest' not in prefs_columns:
+        cursor.execute('ALTER TABLE user_prefs ADD COLUMN digest INTEGER DEFAULT 0')
+    if 'assets' not in prefs_columns:
+        cursor.execute('ALTER TABLE user_prefs ADD COLUMN assets TEXT DEFAULT NULL')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            gift_id INTEGER NOT NULL,
+            name TEXT,
+            model TEXT,
+            asset TEXT,
+            bid REAL,
+            floor REAL,
+            percent REAL,
+            ts REAL NOT NULL -- Unix timestamp отправки уведомления
+        )
+    ''')
+    # Запросы к истории — по пользователю или по модели за интервал времени
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alerts_user_ts ON alerts (user_id, ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_alerts_model_ts ON alerts (name, model, ts)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_filters (
+            user_id INTEGER NOT NULL,
+            list TEXT NOT NULL, -- 'watch' (список отслеживания) или 'block' (список блокировки)
+            name TEXT NOT NULL DEFAULT '', -- заполнено только название — запись по названию
+            model TEXT NOT NULL DEFAULT '', -- название + модель — запись по модели
+            backdrop TEXT NOT NULL DEFAULT '', -- заполнен только фон — запись по фону
+            PRIMARY KEY (user_id, list, name, model, backdrop)
         )
     ''')
     cursor.execute('''
@@ -61,51 +106,85 @@ def init_db():
             username TEXT
         )
     ''')
+    # Поиск по username (в том числе пакетный в /give) без учёта регистра, как в Telegram
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_usernames_username ON usernames (username COLLATE NOCASE)')
     conn.commit()
     conn.close()
     logger.info("База данных инициализирована.")
 
-def get_subscription_end_date(user_id: int) -> float:
-    """Получает дату окончания подписки для пользователя."""
+def _get_subscription_status(user_id: int) -> tuple:
+    """Возвращает (is_admin, end_date) пользователя из кэша, при промахе читает строку из БД."""
+    status = _subscription_cache.get(user_id)
+    if status is None:
+        conn = sqlite3.connect(DATABASE_NAME)
+        cursor = conn.cursor()
+        cursor.execute('SELECT is_admin, end_date FROM subscriptions WHERE user_id = ?', (user_id,))
+        result = cursor.fetchone()
+        conn.close()
+        status = (result[0] == 1, result[1] or 0.0) if result else (False, 0.0)
+        _subscription_cache[user_id] = status
+    return status
+
+def warm_subscription_cache():
+    """Загружает статусы подписки всех пользователей в кэш одним запросом."""
     conn = sqlite3.connect(DATABASE_NAME)
     cursor = conn.cursor()
-    cursor.execute('SELECT end_date FROM subscriptions WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
+    cursor.execute('SELECT user_id, is_admin, end_date FROM subscriptions')
+    rows = cursor.fetchall()
     conn.close()
-    return result[0] if result else 0.0
+    _subscription_cache.clear()
+    for user_id, admin, end_date in rows:
+        _subscription_cache[user_id] = (admin == 1, end_date or 0.0)
+    logger.info("Кэш подписок загружен: %d пользователей.", len(rows))
+
+def invalidate_subscription_cache(user_id: int | None = None):
+    """Сбрасывает кэш статуса подписки пользователя (или всех пользователей, если user_id не указан)."""
+    if user_id is None:
+        _subscription_cache.clear()
+    else:
+        _subscription_cache.pop(user_id, None)
+
+def get_subscription_end_date(user_id: int) -> float:
+    """Получает дату окончания подписки для пользователя."""
+    return _get_subscription_status(user_id)[1]
 
 def set_subscription_end_date(user_id: int, end_date: float):
     """Устанавливает или обновляет дату окончания подписки для пользователя."""
     conn = sqlite3.connect(DATABASE_NAME)
     cursor = conn.cursor()
-    cursor.execute('INSERT OR REPLACE INTO subscriptions (user_id, end_date) VALUES (?, ?)', (user_id, end_date))
+    # UPSERT вместо INSERT OR REPLACE, чтобы не сбрасывать is_admin у существующей строки
+    cursor.execute('''
+        INSERT INTO subscriptions (user_id, end_date) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET end_date = excluded.end_date
+    ''', (user_id, end_date))
     conn.commit()
     conn.close()
+    invalidate_subscription_cache(user_id)
     logger.info("Подписка для пользователя %s установлена до %s", user_id, time.ctime(end_date))
 
 def is_admin(user_id: int) -> bool:
     """Проверяет, является ли пользователь администратором."""
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT is_admin FROM subscriptions WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] == 1 if result else False
+    return _get_subscription_status(user_id)[0]
 
 def set_admin_status(user_id: int, status: bool):
     """Устанавливает или снимает статус администратора для пользователя."""
     conn = sqlite3.connect(DATABASE_NAME)
     cursor = conn.cursor()
-    cursor.execute('INSERT OR REPLACE INTO subscriptions (user_id, is_admin) VALUES (?, ?)', (user_id, 1 if status else 0))
+    # UPSERT вместо INSERT OR REPLACE, чтобы не сбрасывать end_date у существующей строки
+    cursor.execute('''
+        INSERT INTO subscriptions (user_id, is_admin) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET is_admin = excluded.is_admin
+    ''', (user_id, 1 if status else 0))
     conn.commit()
     conn.close()
+    invalidate_subscription_cache(user_id)
     logger.info("Статус администратора для пользователя %s установлен: %s", user_id, status)
 
 def get_user_prefs(user_id: int) -> dict:
     """Получает настройки пользователя из базы данных."""
     conn = sqlite3.connect(DATABASE_NAME)
     cursor = conn.cursor()
-    cursor.execute('SELECT min_profit, interval, price_range_min, price_range_max, active FROM user_prefs WHERE user_id = ?', (user_id,))
+    cursor.execute('SELECT min_profit, interval, price_range_min, price_range_max, active, digest, assets FROM user_prefs WHERE user_id = ?', (user_id,))
     result = cursor.fetchone()
     conn.close()
     if result:
@@ -114,6 +193,8 @@ def get_user_prefs(user_id: int) -> dict:
             'interval': result[1],
             'price_range': (result[2], result[3]),
             'active': bool(result[4]),
+            'digest': bool(result[5]),
+            'assets': tuple(result[6].split(',')) if result[6] else None,
             'notified_ids': set()
         }
     else:
@@ -122,6 +203,8 @@ def get_user_prefs(user_id: int) -> dict:
             'interval': 30,
             'price_range': (5.0, 25.0),
             'active': False,
+            'digest': False,
+            'assets': None,
             'notified_ids': set()
         }
         set_user_prefs(user_id, prefs['min_profit'], prefs['interval'], prefs['price_range'][0], prefs['price_range'][1], prefs['active'])
@@ -131,14 +214,45 @@ def set_user_prefs(user_id: int, min_profit: int, interval: int, price_min: floa
     """Устанавливает настройки пользователя в базу данных."""
     conn = sqlite3.connect(DATABASE_NAME)
     cursor = conn.cursor()
+    # UPSERT вместо INSERT OR REPLACE, чтобы не сбрасывать колонки, которые здесь не передаются (digest)
     cursor.execute('''
-        INSERT OR REPLACE INTO user_prefs (user_id, min_profit, interval, price_range_min, price_range_max, active)
+        INSERT INTO user_prefs (user_id, min_profit, interval, price_range_min, price_range_max, active)
         VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            min_profit = excluded.min_profit,
+            interval = excluded.interval,
+            price_range_min = excluded.price_range_min,
+            price_range_max = excluded.price_range_max,
+            active = excluded.active
     ''', (user_id, min_profit, interval, price_min, price_max, 1 if active else 0))
     conn.commit()
     conn.close()
     logger.info("Настройки пользователя %s обновлены: Прибыль=%s, Интервал=%s, Диапазон=%s-%s, Активен=%s", user_id, min_profit, interval, price_min, price_max, active)
 
+def set_user_digest(user_id: int, digest: bool):
+    """Включает или выключает режим дайджеста (одно сообщение со всеми находками за тик)."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO user_prefs (user_id, digest) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET digest = excluded.digest
+    ''', (user_id, 1 if digest else 0))
+    conn.commit()
+    conn.close()
+    logger.info("Режим дайджеста для пользователя %s: %s", user_id, digest)
+
+def set_user_assets(user_id: int, assets):
+    """Сохраняет валюты аукционов, о которых нужно уведомлять пользователя (None или пустой список — все сканируемые)."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO user_prefs (user_id, assets) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET assets = excluded.assets
+    ''', (user_id, ','.join(assets) if assets else None))
+    conn.commit()
+    conn.close()
+    logger.info("Валюты аукционов для пользователя %s: %s", user_id, assets or "все")
+
 def save_user(user_id: int, username: str):
     """Сохраняет username пользователя."""
     conn = sqlite3.connect(DATABASE_NAME)
@@ -150,10 +264,40 @@ def save_user(user_id: int, username: str):
     conn.close()
 
 def get_user_id_by_username(username: str) -> int | None:
-    with sqlite3.connect(DATABASE_NAME) as conn:
-        cur = conn.execute("SELECT user_id FROM users WHERE username = ?", (username,))
-        result = cur.fetchone()
-        return result[0] if result else None
+    """Ищет user_id по username (без @ и без учёта регистра) в таблице usernames, которую заполняет save_user."""
+    return resolve_users([], [username])[1].get(username.lower())
+
+def resolve_users(user_ids: list, usernames: list) -> tuple[set, dict]:
+    """
+    Пакетная проверка пользователей одним соединением, запросами по SQL_BATCH_SIZE параметров.
+    Возвращает (user_id из user_ids, известные боту по usernames или user_prefs;
+    {username в нижнем регистре: user_id} для найденных usernames).
+    """
+    known_ids = set()
+    found = {}
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    user_ids = list(set(user_ids))
+    for start in range(0, len(user_ids), SQL_BATCH_SIZE):
+        chunk = user_ids[start:start + SQL_BATCH_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f'SELECT user_id FROM usernames WHERE user_id IN ({placeholders}) '
+            f'UNION SELECT user_id FROM user_prefs WHERE user_id IN ({placeholders})',
+            chunk + chunk
+        )
+        known_ids.update(row[0] for row in cursor.fetchall())
+    usernames = list({username.lower() for username in usernames})
+    for start in range(0, len(usernames), SQL_BATCH_SIZE):
+        chunk = usernames[start:start + SQL_BATCH_SIZE]
+        cursor.execute(
+            f'SELECT user_id, username FROM usernames WHERE username COLLATE NOCASE IN ({",".join("?" * len(chunk))})',
+            chunk
+        )
+        for user_id, username in cursor.fetchall():
+            found[username.lower()] = user_id
+    conn.close()
+    return known_ids, found
 
 
 def add_user_if_not_exists(user_id: int, username: str):
@@ -184,3 +328,165 @@ def get_user_by_id(user_id: int):
     user = cur.fetchone()
     conn.close()
     return user
+
+def get_all_subscription_end_dates() -> dict:
+    """Возвращает даты окончания подписок всех пользователей: {user_id: end_date}."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('SELECT user_id, end_date FROM subscriptions')
+    result = {user_id: end_date or 0.0 for user_id, end_date in cursor.fetchall()}
+    conn.close()
+    return result
+
+def add_alerts(rows: list):
+    """
+    Записывает пачку отправленных уведомлений одной транзакцией.
+    Строки: (user_id, gift_id, name, model, asset, bid, floor, percent, ts).
+    """
+    conn = sqlite3.connect(DATABASE_NAME)
+    try:
+        with conn:
+            conn.executemany('''
+                INSERT INTO alerts (user_id, gift_id, name, model, asset, bid, floor, percent, ts)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+    finally:
+        conn.close()
+
+def get_user_alerts(user_id: int, since: float, limit: int) -> list:
+    """Последние уведомления пользователя начиная с since (новые первыми)."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT gift_id, name, model, asset, bid, floor, percent, ts FROM alerts
+        WHERE user_id = ? AND ts >= ? ORDER BY ts DESC LIMIT ?
+    ''', (user_id, since, limit))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+def get_model_alerts(name: str, model: str, since: float, until: float | None = None) -> list:
+    """Уведомления по модели подарка за интервал времени."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT user_id, gift_id, asset, bid, floor, percent, ts FROM alerts
+        WHERE name = ? AND model = ? AND ts >= ? AND ts < ? ORDER BY ts
+    ''', (name, model, since, until if until is not None else float('inf')))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+def get_alerts_summary(since: float, top: int = 5) -> dict:
+    """Сводка по истории уведомлений с момента since: общее число, число пользователей и лотов, самые частые модели."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COUNT(*), COUNT(DISTINCT user_id), COUNT(DISTINCT gift_id), AVG(percent) FROM alerts WHERE ts >= ?
+    ''', (since,))
+    total, users, gifts, avg_percent = cursor.fetchone()
+    cursor.execute('''
+        SELECT name, model, COUNT(*) AS alerts_count, AVG(percent) FROM alerts WHERE ts >= ?
+        GROUP BY name, model ORDER BY alerts_count DESC LIMIT ?
+    ''', (since, top))
+    top_models = cursor.fetchall()
+    conn.close()
+    return {'total': total, 'users': users, 'gifts': gifts, 'avg_percent': avg_percent or 0.0, 'top_models': top_models}
+
+def add_user_filter(user_id: int, list_name: str, name: str = '', model: str = '', backdrop: str = '') -> bool:
+    """Добавляет запись в список отслеживания или блокировки. Возвращает False, если она уже есть."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT OR IGNORE INTO user_filters (user_id, list, name, model, backdrop) VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, list_name, name, model, backdrop))
+    added = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return added
+
+def remove_user_filter(user_id: int, list_name: str, name: str = '', model: str = '', backdrop: str = '') -> bool:
+    """Удаляет запись из списка пользователя. Возвращает False, если её не было."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('''
+        DELETE FROM user_filters WHERE user_id = ? AND list = ? AND name = ? AND model = ? AND backdrop = ?
+    ''', (user_id, list_name, name, model, backdrop))
+    removed = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return removed
+
+def clear_user_filters(user_id: int, list_name: str) -> int:
+    """Очищает список пользователя. Возвращает количество удалённых записей."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM user_filters WHERE user_id = ? AND list = ?', (user_id, list_name))
+    removed = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return removed
+
+def get_user_filters(user_id: int) -> list:
+    """Записи списков пользователя: [(список, название, модель, фон)]."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT list, name, model, backdrop FROM user_filters WHERE user_id = ? ORDER BY list, name, model, backdrop
+    ''', (user_id,))
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+def get_all_user_filters() -> list:
+    """Все записи списков: [(user_id, список, название, модель, фон)] для построения индекса."""
+    conn = sqlite3.connect(DATABASE_NAME)
+    cursor = conn.cursor()
+    cursor.execute('SELECT user_id, list, name, model, backdrop FROM user_filters')
+    result = cursor.fetchall()
+    conn.close()
+    return result
+
+def extend_subscriptions(user_ids: list, period_seconds: float, now: float | None = None) -> dict:
+    """
+    Продлевает подписку пользователям одной транзакцией: end_date = max(end_date, now) + period_seconds,
+    и отмечает их активными в user_prefs. Продление выполняется самим UPDATE, без чтения даты заранее,
+    поэтому одновременные оплаты одного пользователя не теряют друг друга.
+    Возвращает {user_id: новая end_date}.
+    """
+    now = now or time.time()
+    user_ids = list(dict.fromkeys(user_ids))
+    end_dates = {}
+    conn = sqlite3.connect(DATABASE_NAME)
+    try:
+        # BEGIN IMMEDIATE сразу берёт блокировку записи: параллельные продления выполняются по очереди
+        conn.isolation_level = None
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.executemany('''
+                INSERT INTO subscriptions (user_id, end_date) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET end_date = MAX(COALESCE(end_date, 0), ?) + ?
+            ''', [(user_id, now + period_seconds, now, period_seconds) for user_id in user_ids])
+            cursor.executemany('''
+                INSERT INTO user_prefs (user_id, active) VALUES (?, 1)
+                ON CONFLICT(user_id) DO UPDATE SET active = 1
+            ''', [(user_id,) for user_id in user_ids])
+            for start in range(0, len(user_ids), SQL_BATCH_SIZE):
+                chunk = user_ids[start:start + SQL_BATCH_SIZE]
+                cursor.execute(
+                    f'SELECT user_id, end_date FROM subscriptions WHERE user_id IN ({",".join("?" * len(chunk))})',
+                    chunk
+                )
+                end_dates.update(cursor.fetchall())
+            cursor.execute('COMMIT')
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+    finally:
+        conn.close()
+
+    for user_id in user_ids:
+        _subscription_cache.pop(user_id, None)
+    logger.info("Подписка продлена на %.0f сек. для %d пользователей", period_seconds, len(user_ids))
+    return end_dates
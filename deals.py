@@ -0,0 +1,31 @@
+import bisect
+import time
+
+import scanner
+
+
+class DealIndex:
+    """
+    Индекс оценённых лотов последнего тика, заранее отсортированный по проценту прибыли (по убыванию).
+    Процент тот же, что у push-уведомлений (scanner.filter_percent): по текущей или по прогнозной ставке.
+    Отбор по минимальной прибыли — бинарный поиск границы, дальше проверяется только диапазон цен.
+    """
+
+    def __init__(self, lots=(), evaluated_at: float | None = None):
+        self.lots = sorted(lots, key=scanner.filter_percent, reverse=True)
+        # Отрицательные проценты идут по возрастанию, что и нужно для bisect
+        self._neg_percents = [-scanner.filter_percent(lot) for lot in self.lots]
+        self.evaluated_at = evaluated_at if evaluated_at is not None else time.time()
+
+    def query(self, min_profit: float, price_range: tuple, assets=None) -> list:
+        """
+        Возвращает лоты с прибылью не ниже min_profit и ставкой в диапазоне price_range
+        (и в одной из валют assets, если они заданы).
+        """
+        end = bisect.bisect_right(self._neg_percents, -min_profit)
+        min_price, max_price = price_range
+        return [lot for lot in self.lots[:end]
+                if min_price <= lot['bid'] <= max_price and (not assets or lot['asset'] in assets)]
+
+    def __len__(self):
+        return len(self.lots)
@@ -0,0 +1,74 @@
+import asyncio
+import heapq
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiryScheduler:
+    """
+    Отслеживает окончания подписок в min-куче (end_date, user_id) и вызывает обработчик
+    ровно в момент окончания подписки, вместо проверки каждого пользователя на каждом тике.
+    Устаревшие записи кучи (после продления) не удаляются сразу, а пропускаются при извлечении.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._end_dates = {}
+        self._changed = asyncio.Event()
+
+    def load(self, end_dates: dict[int, float]):
+        """Загружает даты окончания подписок всех пользователей (один раз при запуске)."""
+        self._end_dates = {user_id: end_date for user_id, end_date in end_dates.items() if end_date > 0}
+        self._heap = [(end_date, user_id) for user_id, end_date in self._end_dates.items()]
+        heapq.heapify(self._heap)
+        self._changed.set()
+        logger.info("Загружено подписок для отслеживания окончания: %d", len(self._heap))
+
+    def update(self, user_id: int, end_date: float):
+        """Обновляет дату окончания подписки пользователя (после оплаты или выдачи подписки)."""
+        if self._end_dates.get(user_id) == end_date:
+            return
+        self._end_dates[user_id] = end_date
+        if end_date > 0:
+            heapq.heappush(self._heap, (end_date, user_id))
+        self._changed.set()
+
+    def end_date(self, user_id: int) -> float:
+        """Возвращает дату окончания подписки пользователя (0, если подписки не было)."""
+        return self._end_dates.get(user_id, 0.0)
+
+    def is_active(self, user_id: int, now: float | None = None) -> bool:
+        """Проверяет, действует ли подписка пользователя."""
+        return (now or time.time()) < self.end_date(user_id)
+
+    def pop_expired(self, now: float) -> list[int]:
+        """Извлекает из кучи пользователей, чья подписка закончилась к моменту now."""
+        expired = []
+        while self._heap and self._heap[0][0] <= now:
+            end_date, user_id = heapq.heappop(self._heap)
+            # Запись устарела, если подписку с тех пор продлили
+            if self._end_dates.get(user_id) == end_date:
+                expired.append(user_id)
+        return expired
+
+    async def run(self, on_expire):
+        """
+        Бесконечный цикл: спит до ближайшего окончания подписки (или до изменения кучи)
+        и вызывает корутину on_expire(user_id) для каждой закончившейся подписки.
+        """
+        logger.info("Запущено отслеживание окончания подписок.")
+        while True:
+            self._changed.clear()
+            for user_id in self.pop_expired(time.time()):
+                try:
+                    await on_expire(user_id)
+                except Exception as e:
+                    logger.error("Ошибка при обработке окончания подписки пользователя %s: %s", user_id, e)
+
+            timeout = max(0.0, self._heap[0][0] - time.time()) if self._heap else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
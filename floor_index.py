@@ -0,0 +1,84 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Уровни детализации floor-цены, от самого точного к самому грубому
+LEVEL_BACKDROP = 'backdrop'
+LEVEL_MODEL = 'model'
+LEVEL_NAME = 'name'
+
+
+class FloorIndex:
+    """
+    Предрассчитанный индекс floor-цен из filterStats с тремя уровнями детализации:
+    название, название + модель, название + модель + фон.
+    Строится один раз на каждое обновление filterStats, поиск — несколько обращений к словарям.
+    """
+
+    def __init__(self):
+        self.by_name = {}
+        self.by_model = {}
+        self.by_backdrop = {}
+
+    @classmethod
+    def build(cls, floor_prices: dict) -> 'FloorIndex':
+        """
+        Строит индекс из словаря floor-цен filterStats.
+        Ключи вида "Имя_Модель" дают уровень модели, "Имя_Модель_Фон" — уровень фона, "Имя" — уровень названия.
+        Если более грубый уровень не пришёл в ответе явно, он считается как минимум по более точным.
+        """
+        index = cls()
+        explicit_names = {}
+        explicit_models = {}
+
+        for key, floor_price in floor_prices.items():
+            if floor_price is None:
+                continue
+            try:
+                floor_price = float(floor_price)
+            except (TypeError, ValueError):
+                continue
+
+            parts = key.split('_', 2)
+            if len(parts) == 1:
+                explicit_names[parts[0]] = floor_price
+            elif len(parts) == 2:
+                explicit_models[(parts[0], parts[1])] = floor_price
+                index._update_min(index.by_name, parts[0], floor_price)
+            else:
+                index.by_backdrop[(parts[0], parts[1], parts[2])] = floor_price
+                index._update_min(index.by_model, (parts[0], parts[1]), floor_price)
+                index._update_min(index.by_name, parts[0], floor_price)
+
+        # Явно пришедшие значения важнее рассчитанных минимумов
+        index.by_model.update(explicit_models)
+        index.by_name.update(explicit_names)
+        logger.debug("Индекс floor-цен построен: названий %d, моделей %d, фонов %d",
+                     len(index.by_name), len(index.by_model), len(index.by_backdrop))
+        return index
+
+    @staticmethod
+    def _update_min(mapping: dict, key, floor_price: float):
+        current = mapping.get(key)
+        if current is None or floor_price < current:
+            mapping[key] = floor_price
+
+    def lookup(self, name: str, model: str, backdrop: str | None = None) -> tuple:
+        """
+        Ищет floor-цену сначала по названию + модели + фону, затем по названию + модели, затем по названию.
+        Возвращает (floor-цена, уровень) или (None, None), если цены нет ни на одном уровне.
+        """
+        if backdrop is not None:
+            floor_price = self.by_backdrop.get((name, model, backdrop))
+            if floor_price is not None:
+                return floor_price, LEVEL_BACKDROP
+        floor_price = self.by_model.get((name, model))
+        if floor_price is not None:
+            return floor_price, LEVEL_MODEL
+        floor_price = self.by_name.get(name)
+        if floor_price is not None:
+            return floor_price, LEVEL_NAME
+        return None, None
+
+    def __len__(self):
+        return len(self.by_name) + len(self.by_model) + len(self.by_backdrop)
@@ -0,0 +1,69 @@
+import asyncio
+import collections
+import logging
+import time
+
+import config
+import db
+import scanner
+
+logger = logging.getLogger(__name__)
+
+
+class AlertHistoryWriter:
+    """
+    Буфер истории отправленных уведомлений. Стадия доставки только добавляет записи в очередь в памяти,
+    а фоновая задача run() раз в HISTORY_FLUSH_INTERVAL секунд (или при накоплении HISTORY_BATCH_SIZE записей)
+    пишет их в таблицу alerts пачками, одной транзакцией на пачку, в отдельном потоке.
+    Очередь ограничена HISTORY_MAX_PENDING: если база не успевает, старые записи отбрасываются,
+    а не тормозят конвейер сканирования.
+    """
+
+    def __init__(self, batch_size: int | None = None, flush_interval: float | None = None, max_pending: int | None = None):
+        self.batch_size = batch_size or config.HISTORY_BATCH_SIZE
+        self.flush_interval = flush_interval or config.HISTORY_FLUSH_INTERVAL
+        self._pending = collections.deque(maxlen=max_pending or config.HISTORY_MAX_PENDING)
+        self._wakeup = asyncio.Event()
+        self.written = 0
+        self.dropped = 0
+
+    def add(self, user_id: int, lots: list, ts: float | None = None):
+        """Ставит в очередь на запись лоты, о которых пользователь только что получил уведомление."""
+        ts = ts or time.time()
+        for lot in lots:
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append((
+                user_id, lot['gift_id'], lot['name'], lot['model'], lot.get('asset', scanner.DEFAULT_ASSET),
+                lot['bid'], lot['floor'], lot['percent'], ts,
+            ))
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    async def run(self):
+        """Фоновая задача периодической записи очереди в БД."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Записывает всё накопленное пачками по batch_size."""
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                await asyncio.to_thread(db.add_alerts, batch)
+                self.written += len(batch)
+            except Exception as e:
+                self.dropped += len(batch)
+                logger.error("[ERROR] Не удалось записать историю уведомлений (%d записей): %s", len(batch), e)
+                return
+        if self.dropped:
+            logger.warning("История уведомлений: отброшено записей %d (база не успевала)", self.dropped)
+            self.dropped = 0
+
+    def __len__(self):
+        return len(self._pending)
@@ -0,0 +1,234 @@
+import asyncio
+import itertools
+import logging
+import time
+
+import config
+import deals
+import scanner
+import settings_store
+import watchlist
+
+logger = logging.getLogger(__name__)
+
+# Стадии после получения снимка аукционов (fetch), в порядке прохождения данных
+STAGES = ('parse', 'enrich', 'match', 'deliver')
+
+
+class ScanPipeline:
+    """
+    Конвейер сканирования аукционов: fetch → parse → enrich (floor-цена и прибыль) → match → deliver.
+    Стадии работают параллельно и связаны ограниченными очередями asyncio.Queue: если стадия
+    не успевает (например, доставка упирается в лимиты Telegram), предыдущая ждёт на put
+    вместо того, чтобы копить данные в памяти.
+    Пользователям в режиме дайджеста находки за тик копятся и уходят на доставку одним сообщением
+    после стадии match. По итогам тика строится индекс всех оценённых лотов (deals) для /deals.
+    Если передан tracker (analytics.BidTracker), стадия enrich дополняет лоты скоростью ставок
+    и прогнозом итоговой ставки. on_delivered(user_id, lots) вызывается после успешной доставки
+    (например, для записи истории уведомлений) и не должен блокировать.
+    Если передан tracer (tracing.LatencyTracer), стадии ставят лотам отметки времени для трассировки задержек;
+    get_fetched_at() возвращает время получения снимка pageGifts (по умолчанию — момент возврата fetch()).
+    filters (watchlist.WatchlistIndex) определяет, кому из пользователей со списками отслеживания
+    или блокировки передавать лот на стадии match; индекс можно заменить между тиками.
+    settings (settings_store.SettingsStore) — настройки пользователей, по которым отбираются лоты.
+    """
+
+    def __init__(self, floor_lookup, send, workers: dict | None = None, queue_size: int | None = None, tracker=None,
+                 on_delivered=None, tracer=None, filters=None, settings=None, get_fetched_at=None):
+        self.floor_lookup = floor_lookup
+        self.send = send
+        self.settings = settings if settings is not None else settings_store.SettingsStore()
+        self.tracker = tracker
+        self.on_delivered = on_delivered
+        self.tracer = tracer
+        self.get_fetched_at = get_fetched_at
+        self.filters = filters or watchlist.WatchlistIndex()
+        self.workers = {**config.PIPELINE_WORKERS, **(workers or {})}
+        self.queue_size = queue_size or config.PIPELINE_QUEUE_SIZE
+        self.queues = {}
+        self.processed = dict.fromkeys(STAGES, 0)
+        self.max_depth = dict.fromkeys(STAGES, 0)
+        self.users = []
+        self._open_rows = []
+        self._rows_by_id = {}
+        self._tick_filters = self.filters
+        self._digests = {}
+        self._evaluated = []
+        self.deals = deals.DealIndex()
+        self.tick_time = 0.0
+        self._tasks = []
+
+    def start(self):
+        """Создаёт очереди и запускает воркеры всех стадий. Вызывается внутри работающего event loop."""
+        handlers = {
+            'parse': self._parse,
+            'enrich': self._enrich,
+            'match': self._match,
+            'deliver': self._deliver,
+        }
+        for stage in STAGES:
+            self.queues[stage] = asyncio.Queue(maxsize=self.queue_size)
+        for stage in STAGES:
+            for number in range(self.workers[stage]):
+                self._tasks.append(asyncio.create_task(self._worker(stage, handlers[stage]), name=f"pipeline-{stage}-{number}"))
+        logger.info("Конвейер сканирования запущен: воркеров %s, размер очередей %d", self.workers, self.queue_size)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def queue_depths(self) -> dict:
+        """Текущая глубина очереди перед каждой стадией."""
+        return {stage: queue.qsize() for stage, queue in self.queues.items()}
+
+    async def run_tick(self, fetch, users: list, now: float | None = None) -> bool:
+        """
+        Выполняет один тик: стадия fetch (корутина fetch() возвращает список аукционов или None)
+        отдаёт аукционы в конвейер, после чего тик ждёт, пока все стадии обработают данные.
+        users — список user_id активных пользователей для стадии match (настройки берутся из self.settings).
+        now — время снимка для аналитики ставок (по умолчанию get_fetched_at() или текущее, replay передаёт
+        время записи). Лоты с полем fetched_at (время получения их ответа pageGifts) учитываются аналитикой
+        по нему, поэтому повторно использованный снимок не добавляет в скорость ставок нулевых замеров.
+        Возвращает False, если получить аукционы не удалось.
+        """
+        auctions = await fetch()
+        if auctions is None:
+            return False
+
+        if now is None:
+            now = self.get_fetched_at() if self.get_fetched_at is not None else time.time()
+        self.tick_time = now
+        if self.tracker is not None:
+            self.tracker.start_tick()
+        if self.tracer is not None:
+            self.tracer.start_tick(self.get_fetched_at() if self.get_fetched_at is not None else time.time())
+        self.users = users
+        # Настройки и индекс фиксируются на тик. Пользователи без списка отслеживания проверяются на каждом лоте,
+        # остальные — только если лот есть в их списке
+        self._tick_filters = self.filters
+        watchers = self._tick_filters.watchers
+        rows = self.settings.match_rows(users)
+        self._open_rows = [row for row in rows if row[0] not in watchers] if watchers else rows
+        self._rows_by_id = {row[0]: row for row in rows}
+        self.max_depth = dict.fromkeys(STAGES, 0)
+        self._evaluated = []
+        for gift in auctions:
+            await self._put('parse', gift)
+
+        # Элемент передаётся на следующую стадию до task_done() на текущей,
+        # поэтому последовательный join по стадиям дожидается полного прохождения тика
+        for stage in STAGES:
+            await self.queues[stage].join()
+            if stage == 'match':
+                await self._flush_digests()
+
+        if self.tracker is not None:
+            self.tracker.end_tick()
+        if self.tracer is not None:
+            self.tracer.end_tick()
+        self.deals = deals.DealIndex(self._evaluated)
+        logger.info("Тик конвейера завершён: аукционов %d, макс. глубина очередей %s", len(auctions), self.max_depth)
+        return True
+
+    async def _put(self, stage: str, item):
+        queue = self.queues[stage]
+        await queue.put(item)
+        if queue.qsize() > self.max_depth[stage]:
+            self.max_depth[stage] = queue.qsize()
+
+    async def _worker(self, stage: str, handler):
+        queue = self.queues[stage]
+        while True:
+            item = await queue.get()
+            try:
+                await handler(item)
+                self.processed[stage] += 1
+            except Exception as e:
+                logger.error("[ERROR] Ошибка на стадии %s конвейера: %s", stage, e)
+            finally:
+                queue.task_done()
+
+    async def _parse(self, gift: dict):
+        if gift.get('gift_id') is None:
+            logger.warning("Объект подарка без gift_id: %s", gift)
+            return
+        lot = scanner.parse_lot(gift)
+        if self.tracer is not None:
+            self.tracer.seen(lot)
+        await self._put('enrich', lot)
+
+    async def _enrich(self, lot: dict):
+        if self.tracker is not None:
+            fetched_at = lot.get('fetched_at')
+            self.tracker.observe(lot, fetched_at if fetched_at is not None else self.tick_time)
+        if scanner.evaluate_lot(lot, self.floor_lookup):
+            if self.tracer is not None:
+                self.tracer.stamp(lot, 'floor_resolved')
+            self._evaluated.append(lot)
+            await self._put('match', lot)
+
+    async def _match(self, lot: dict):
+        watched, blocked = self._tick_filters.lookup(lot)
+        candidates = self._open_rows
+        if watched:
+            candidates = itertools.chain(candidates, (
+                self._rows_by_id[user_id] for user_id in watched if user_id in self._rows_by_id
+            ))
+        store = self.settings
+        notified_ids = store.notified_ids
+        gift_id, bid = lot['gift_id'], lot['bid']
+        percent = scanner.filter_percent(lot)
+        asset_bit = store.asset_bit(lot['asset'])
+        # Лот подходит, если валюта среди выбранных пользователем (маска 0 — все сканируемые),
+        # ставка в диапазоне цен, прибыль не ниже минимальной и пользователь о нём ещё не уведомлён
+        for user_id, slot, min_profit, price_min, price_max, asset_mask in candidates:
+            if percent < min_profit or not price_min <= bid <= price_max:
+                continue
+            if asset_mask and not asset_mask & asset_bit:
+                continue
+            if blocked and user_id in blocked:
+                continue
+            notified = notified_ids[slot]
+            if notified is None:
+                notified = store.notified(slot)
+            elif gift_id in notified:
+                continue
+            # Отмечаем сразу, чтобы параллельная доставка не отправила лот дважды
+            notified.add(gift_id)
+            if self.tracer is not None:
+                self.tracer.stamp(lot, 'matched')
+            if store.digest.get(slot):
+                self._digests.setdefault(user_id, (slot, []))[1].append(lot)
+            else:
+                await self._put('deliver', (user_id, slot, [lot]))
+
+    async def _flush_digests(self):
+        digests, self._digests = self._digests, {}
+        for user_id, (slot, lots) in digests.items():
+            await self._put('deliver', (user_id, slot, lots))
+
+    async def _deliver(self, item: tuple):
+        user_id, slot, lots = item
+        if self.settings.digest.get(slot):
+            texts = scanner.format_digest(lots)
+        else:
+            texts = [scanner.format_alert(lot) for lot in lots]
+
+        for text in texts:
+            try:
+                await self.send(chat_id=user_id, text=text)
+            except Exception as e:
+                # Не доставили — пусть лоты попробуют уйти на следующем тике
+                notified = self.settings.notified(slot)
+                for lot in lots:
+                    notified.discard(lot['gift_id'])
+                logger.error("[ERROR] Не удалось отправить уведомление (%d лотов) пользователю %s: %s", len(lots), user_id, e)
+                return
+        if self.tracer is not None:
+            self.tracer.sent(user_id, lots)
+        if self.on_delivered is not None:
+            self.on_delivered(user_id, lots)
+        logger.info("Отправлено уведомление о подарках %s (сообщений: %d) пользователю %s",
+                    [lot['gift_id'] for lot in lots], len(texts), user_id)
@@ -0,0 +1,96 @@
+import gzip
+import json
+import logging
+import queue
+import threading
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+class AuctionRecorder:
+    """
+    Дописывает сырые ответы tonnel (pageGifts, filterStats) с отметкой времени
+    в сжатый gzip-журнал формата JSON Lines. Файл открывается в режиме добавления,
+    поэтому журнал продолжается между перезапусками бота.
+    record() только ставит ответ в очередь: декодирование, сжатие и запись идут в отдельном потоке,
+    чтобы большие ответы filterStats не задерживали event loop.
+    """
+
+    def __init__(self, path: str, max_pending: int | None = None):
+        self.path = path
+        self._file = gzip.open(path, 'at', encoding='utf-8')
+        self._queue = queue.Queue(maxsize=max_pending or config.RECORD_MAX_PENDING)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._write_loop, name="auction-recorder", daemon=True)
+        self._thread.start()
+        logger.info("Запись ответов tonnel включена: %s", path)
+
+    def record(self, kind: str, body: bytes | str, ts: float | None = None, asset: str | None = None):
+        """
+        Ставит один ответ в очередь на запись. kind — имя эндпоинта, body — тело ответа как есть
+        (bytes декодируются в потоке записи), asset — валюта запроса.
+        """
+        try:
+            self._queue.put_nowait((ts or time.time(), kind, body, asset))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self._write(*item)
+            # Сбрасываем буфер, когда очередь опустела, чтобы журнал читался даже при аварийном завершении процесса
+            if self._queue.empty():
+                self._flush()
+        self._flush()
+
+    def _write(self, ts: float, kind: str, body: bytes | str, asset: str | None):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', errors='replace')
+        entry = {'ts': ts, 'kind': kind, 'body': body}
+        if asset:
+            entry['asset'] = asset
+        try:
+            self._file.write(json.dumps(entry, ensure_ascii=False))
+            self._file.write('\n')
+        except Exception as e:
+            logger.error("Не удалось записать ответ %s в журнал %s: %s", kind, self.path, e)
+
+    def _flush(self):
+        try:
+            self._file.flush()
+        except Exception as e:
+            logger.error("Не удалось сбросить журнал %s: %s", self.path, e)
+        if self.dropped:
+            logger.warning("Журнал ответов tonnel: отброшено записей %d (запись не успевала)", self.dropped)
+            self.dropped = 0
+
+    def close(self):
+        """Дописывает очередь и закрывает журнал."""
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+def read_records(path: str):
+    """
+    Читает журнал, записанный AuctionRecorder, и по одной возвращает записи
+    вида {'ts': ..., 'kind': ..., 'body': ...} (у записей с валютой — ещё 'asset'). Оборванный хвост (после падения процесса) пропускается.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Пропущена повреждённая запись в журнале %s", path)
+        except EOFError:
+            logger.warning("Журнал %s обрывается на незавершённой записи", path)
@@ -0,0 +1,151 @@
+"""
+Воспроизведение журнала ответов tonnel, записанного AuctionRecorder (config.RECORD_PATH).
+
+Прогоняет записанные pageGifts/filterStats через тот же конвейер разбора, оценки и доставки
+уведомлений (pipeline.py), что и бот, но вместо Telegram отправляет сообщения в заглушку. Используется для замера
+производительности конвейера и для проверки настроек min_profit и наценки на исторических данных.
+
+Примеры:
+    python replay.py tonnel_record.jsonl.gz
+    python replay.py tonnel_record.jsonl.gz --pace original --speed 10
+    python replay.py tonnel_record.jsonl.gz --min-profit 0 5 10 --markup 1.03
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+import analytics
+import config
+import floor_index
+import pipeline
+import recorder
+import scanner
+import settings_store
+
+logger = logging.getLogger(__name__)
+
+
+class StubBot:
+    """Заглушка бота: запоминает отправленные сообщения вместо обращения к Telegram."""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+async def replay(path: str, pace: str, speed: float, profits: list[int], price_range: tuple[float, float]) -> dict:
+    """
+    Воспроизводит журнал. Для каждого значения min_profit заводится отдельный виртуальный пользователь,
+    чтобы за один проход сравнить несколько порогов (повторяющиеся значения учитываются один раз).
+    Возвращает статистику прогона.
+    """
+    # Статистика уведомлений ключуется порогом, поэтому одинаковые пороги схлопываются заранее
+    profits = list(dict.fromkeys(profits))
+    stub = StubBot()
+    users = settings_store.SettingsStore()
+    users.update({
+        index: {'min_profit': profit, 'interval': config.DEFAULT_INTERVAL, 'price_range': price_range, 'active': True}
+        for index, profit in enumerate(profits)
+    })
+    # Индекс floor-цен TON и последние снимки аукционов по валютам, как в боте
+    floors = {}
+    snapshots = {}
+
+    def floor_lookup(name, model, backdrop, asset):
+        # Как get_floor_price в боте: цены TON, для других валют — пересчёт по ASSET_PER_TON
+        index = floors.get(scanner.DEFAULT_ASSET)
+        if index is None:
+            return None, None
+        floor_price, floor_level = index.lookup(name, model, backdrop)
+        floor_price = scanner.convert_floor(floor_price, asset)
+        return (floor_price, floor_level) if floor_price is not None else (None, None)
+
+    scan_pipeline = pipeline.ScanPipeline(floor_lookup, stub.send_message, tracker=analytics.BidTracker(), settings=users)
+    scan_pipeline.start()
+
+    stats = {'records': 0, 'snapshots': 0, 'lots': 0, 'bad_records': 0, 'pipeline_time': 0.0}
+    first_ts = None
+    started_at = time.perf_counter()
+
+    for record in recorder.read_records(path):
+        stats['records'] += 1
+
+        if pace == 'original':
+            if first_ts is None:
+                first_ts = record['ts']
+            delay = (record['ts'] - first_ts) / speed - (time.perf_counter() - started_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        tick_started = time.perf_counter()
+        try:
+            data = scanner.loads(record['body'])
+        except json.JSONDecodeError:
+            stats['bad_records'] += 1
+            continue
+
+        # Записи до появления нескольких валют не содержат asset и относятся к TON
+        asset = record.get('asset', scanner.DEFAULT_ASSET)
+        if record['kind'] == 'filterStats':
+            # Ответы filterStats с другой валютой (из старых журналов) не используются: цены в них не подтверждены
+            if asset == scanner.DEFAULT_ASSET:
+                floors[asset] = floor_index.FloorIndex.build(scanner.parse_floor_prices(data))
+        elif record['kind'] == 'pageGifts':
+            snapshots[asset] = scanner.parse_auctions(data)
+            for gift in snapshots[asset]:
+                gift['asset'] = asset
+            stats['snapshots'] += 1
+            stats['lots'] += len(snapshots[asset])
+            # Тик идёт по объединённому снимку всех валют, как в боте
+            auctions = [gift for asset_auctions in snapshots.values() for gift in asset_auctions]
+
+            async def fetch():
+                return auctions
+
+            await scan_pipeline.run_tick(fetch, list(users.slots), now=record['ts'])
+        stats['pipeline_time'] += time.perf_counter() - tick_started
+
+    await scan_pipeline.stop()
+    stats['wall_time'] = time.perf_counter() - started_at
+    stats['alerts'] = {profits[user_id]: sum(1 for chat_id, _ in stub.sent if chat_id == user_id) for user_id in users.slots}
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Воспроизведение журнала ответов tonnel через конвейер оценки аукционов.")
+    parser.add_argument("path", help="Путь к журналу (gzip JSON Lines)")
+    parser.add_argument("--pace", choices=["fast", "original"], default="fast",
+                        help="fast — без пауз, original — с исходными интервалами между ответами")
+    parser.add_argument("--speed", type=float, default=1.0, help="Ускорение для --pace original")
+    parser.add_argument("--min-profit", type=int, nargs="+", default=[config.DEFAULT_MIN_PROFIT],
+                        help="Один или несколько порогов минимальной прибыли в процентах")
+    parser.add_argument("--price-range", type=float, nargs=2, default=(0.0, float("inf")),
+                        metavar=("MIN", "MAX"), help="Диапазон ставок в TON")
+    parser.add_argument("--markup", type=float, default=config.FLOOR_MARKUP, help="Наценка к floor-цене")
+    parser.add_argument("--commission", type=float, default=config.SALE_COMMISSION_FACTOR,
+                        help="Доля, остающаяся после комиссии маркетплейса")
+    parser.add_argument("--projected", action="store_true",
+                        help="Сравнивать с min_profit прибыль по прогнозной итоговой ставке")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    config.FLOOR_MARKUP = args.markup
+    config.SALE_COMMISSION_FACTOR = args.commission
+    config.PROFIT_USE_PROJECTED_BID = args.projected
+
+    stats = asyncio.run(replay(args.path, args.pace, args.speed, args.min_profit, tuple(args.price_range)))
+
+    print(f"Записей: {stats['records']} (повреждённых: {stats['bad_records']}), снимков pageGifts: {stats['snapshots']}, лотов: {stats['lots']}")
+    print(f"Время прогона: {stats['wall_time']:.3f} сек., из них в конвейере: {stats['pipeline_time']:.3f} сек.")
+    if stats['pipeline_time'] > 0:
+        print(f"Пропускная способность: {stats['lots'] / stats['pipeline_time']:.0f} лотов/сек.")
+    for profit, count in stats['alerts'].items():
+        print(f"min_profit={profit}%: уведомлений {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import datetime
+import json
+import logging
+
+try:
+    import orjson
+except ImportError: # orjson необязателен, без него используется стандартный json
+    orjson = None
+
+import config
+import floor_index
+
+logger = logging.getLogger(__name__)
+
+# Логика разбора и оценки аукционов, используемая стадиями конвейера сканирования (pipeline.py).
+
+# Валюта лота, если pageGifts её не указал
+DEFAULT_ASSET = 'TON'
+
+
+def loads(body):
+    """
+    Декодирует JSON из bytes/str, используя orjson, если он установлен.
+    Ошибки разбора в обоих случаях — подклассы json.JSONDecodeError.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def parse_auctions(data) -> list:
+    """
+    Извлекает список аукционов из ответа pageGifts (список или словарь с ключом 'auctions').
+    """
+    return data if isinstance(data, list) else data.get('auctions', [])
+
+
+def parse_floor_prices(data) -> dict:
+    """
+    Извлекает floor-цены из ответа filterStats.
+    Ожидаемая структура: {"data": {"GiftName_ModelName": {"floorPrice": 123.45, ...}}}
+    Возвращает словарь "Имя_Модель" -> floorPrice.
+    """
+    floor_data = data.get("data", {})
+    return {
+        key: stats.get("floorPrice") for key, stats in floor_data.items() if isinstance(stats, dict)
+    }
+
+
+def extract_floor_prices(body: bytes) -> dict:
+    """
+    Разбирает тело ответа filterStats и оставляет только floorPrice.
+    Функция верхнего уровня, чтобы её можно было выполнить в пуле процессов.
+    """
+    return parse_floor_prices(loads(body))
+
+
+def parse_lot(gift: dict) -> dict:
+    """
+    Приводит объект подарка из pageGifts к плоскому словарю с полями, нужными для оценки и уведомления.
+    """
+    auction_data = gift.get('auction', {})
+    bid_history = auction_data.get('bidHistory', [])
+
+    bid = float(bid_history[-1]['amount']) if bid_history else float(auction_data.get('startingBid', 0))
+
+    end_time_raw = auction_data.get('auctionEndTime', '')
+    end_time = end_time_raw[:19].replace('T', ' ') if end_time_raw else 'N/A'
+    end_ts = None
+    if end_time_raw:
+        try:
+            # Время окончания приходит в UTC
+            end_ts = datetime.datetime.fromisoformat(end_time_raw[:19]).replace(tzinfo=datetime.timezone.utc).timestamp()
+        except ValueError:
+            pass
+
+    return {
+        'gift_id': gift.get('gift_id'),
+        'name': gift.get('name', 'N/A'),
+        'model': gift.get('model', 'N/A'),
+        'backdrop': gift.get('backdrop', 'N/A'),
+        'bid': bid,
+        'bid_count': len(bid_history),
+        'end_time': end_time,
+        'end_ts': end_ts,
+        'gift_num': gift.get('gift_num', gift.get('gift_id', 'N/A')),
+        'asset': gift.get('asset') or DEFAULT_ASSET,
+        'fetched_at': gift.get('fetched_at'),
+    }
+
+
+def calc_profit(bid: float, floor_price: float) -> tuple[float, float]:
+    """
+    Считает ожидаемую прибыль при перепродаже по floor-цене с наценкой за вычетом комиссии.
+    Ставка и floor-цена в одной валюте. Возвращает (прибыль в этой валюте, прибыль в процентах от ставки).
+    """
+    floor_with_markup = floor_price * config.FLOOR_MARKUP
+    after_commission = floor_with_markup * config.SALE_COMMISSION_FACTOR
+    profit = after_commission - bid
+    percent = (profit / bid) * 100 if bid > 0 else -100
+    return profit, percent
+
+
+# Максимальная длина текста одного сообщения Telegram (в UTF-16 кодовых единицах, как считает Telegram)
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Пояснение к floor-цене, если она найдена не на уровне название + модель
+FLOOR_LEVEL_NOTES = {
+    floor_index.LEVEL_BACKDROP: " (с учётом фона)",
+    floor_index.LEVEL_NAME: " (минимум по названию)",
+}
+
+
+def format_alert(lot: dict) -> str:
+    """
+    Формирует текст уведомления о выгодном аукционе по оценённому лоту (см. evaluate_lot).
+    """
+    return (
+        f"🎁Название: {lot['name']}\n"
+        f"Модель: {lot['model']}\n"
+        f"Фон: {lot['backdrop']}\n"
+        f"⏳Заканчивается: {lot['end_time']}\n"
+        f"💰Ставка: {lot['bid']:.2f} {lot['asset']}\n"
+        f"Tonnel Floor: {lot['floor']:.2f} {lot['asset']}{FLOOR_LEVEL_NOTES.get(lot['floor_level'], '')}\n"
+        f"💵Прибыль: +{lot['percent']:.1f}% ({lot['profit']:.2f} {lot['asset']})\n"
+        f"{format_projection(lot)}"
+        f"🔗Прямая ссылка: {gift_link(lot)}"
+    )
+
+
+def format_projection(lot: dict) -> str:
+    """Строка с прогнозом итоговой ставки (если лот отслеживается аналитикой ставок) или пустая строка."""
+    if lot.get('projected_percent') is None:
+        return ""
+    return (f"📈Ставок: {lot['bid_count']} ({lot['bid_rate']:.1f}/мин), "
+            f"прогноз: {lot['projected_bid']:.2f} {lot['asset']} ({lot['projected_percent']:+.1f}%)\n")
+
+
+def gift_link(lot: dict) -> str:
+    gift_num = lot['gift_num']
+    return f"https://t.me/tonnel_network_bot/gift?startapp={gift_num}" if gift_num != 'N/A' else 'Ссылка недоступна'
+
+
+def format_lot_short(lot: dict) -> str:
+    """Краткое описание оценённого лота для списков (дайджест, /deals)."""
+    return (
+        f"🎁{lot['name']} | {lot['model']} | {lot['backdrop']}\n"
+        f"💰{lot['bid']:.2f} {lot['asset']} → Floor {lot['floor']:.2f} {lot['asset']}{FLOOR_LEVEL_NOTES.get(lot['floor_level'], '')}\n"
+        f"💵{lot['percent']:+.1f}% ({lot['profit']:.2f} {lot['asset']}), ⏳{lot['end_time']}\n"
+        f"🔗{gift_link(lot)}"
+    )
+
+
+def telegram_length(text: str) -> int:
+    """Длина текста так, как её считает Telegram: эмодзи вне BMP занимают две единицы."""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def format_digest(lots: list) -> list[str]:
+    """
+    Формирует дайджест: все подходящие лоты за тик одним списком, отсортированным по проценту прибыли.
+    Возвращает список сообщений, каждое не длиннее TELEGRAM_MESSAGE_LIMIT.
+    """
+    entries = [format_lot_short(lot) for lot in sorted(lots, key=lambda lot: lot['percent'], reverse=True)]
+
+    messages = []
+    current = f"📬 Выгодных аукционов: {len(lots)}"
+    current_length = telegram_length(current)
+    for entry in entries:
+        entry_length = telegram_length(entry)
+        if current_length + 2 + entry_length > TELEGRAM_MESSAGE_LIMIT:
+            messages.append(current)
+            current, current_length = entry, entry_length
+        else:
+            current = f"{current}\n\n{entry}"
+            current_length += 2 + entry_length
+    messages.append(current)
+    return messages
+
+
+def evaluate_lot(lot: dict, floor_lookup) -> bool:
+    """
+    Дополняет лот floor-ценой и ожидаемой прибылью (не зависят от пользователя).
+    floor_lookup(name, model, backdrop, asset) возвращает (floor-цена, уровень) или (None, None).
+    Возвращает False, если floor-цену найти не удалось.
+    """
+    floor_price, floor_level = floor_lookup(lot['name'], lot['model'], lot['backdrop'], lot['asset'])
+    if floor_price is None:
+        logger.warning("Не удалось получить floor price для %s_%s. Пропускаем подарок %s.",
+                       lot['name'], lot['model'], lot['gift_id'])
+        return False
+
+    lot['floor'] = floor_price
+    lot['floor_level'] = floor_level
+    lot['profit'], lot['percent'] = calc_profit(lot['bid'], floor_price)
+    if lot.get('projected_bid') is not None:
+        lot['projected_profit'], lot['projected_percent'] = calc_profit(lot['projected_bid'], floor_price)
+    return True
+
+
+def enabled_assets(assets) -> list:
+    """Валюты из assets, для которых известна floor-цена: TON и валюты с курсом в ASSET_PER_TON."""
+    return [asset for asset in assets if asset == DEFAULT_ASSET or config.ASSET_PER_TON.get(asset)]
+
+
+def convert_floor(floor_price: float | None, asset: str) -> float | None:
+    """Пересчитывает floor-цену из TON в валюту asset по курсу ASSET_PER_TON (None, если курса нет)."""
+    if floor_price is None or asset == DEFAULT_ASSET:
+        return floor_price
+    rate = config.ASSET_PER_TON.get(asset)
+    return floor_price * rate if rate else None
+
+
+def filter_percent(lot: dict) -> float:
+    """
+    Процент прибыли, по которому лот сравнивается с min_profit: по текущей ставке
+    или, если включено PROFIT_USE_PROJECTED_BID, по прогнозной итоговой ставке.
+    Лот, который аналитика ставок видит впервые (прогноза ещё нет), в режиме прогноза ждёт следующего снимка.
+    """
+    if config.PROFIT_USE_PROJECTED_BID and 'projected_bid' in lot:
+        projected = lot.get('projected_percent')
+        return projected if projected is not None else float('-inf')
+    return lot['percent']
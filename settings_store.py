@@ -0,0 +1,208 @@
+from array import array
+from collections.abc import MutableMapping
+
+# Поля настроек пользователя в том порядке, в котором их отдаёт db.get_user_prefs
+FIELDS = ('min_profit', 'interval', 'price_range', 'active', 'digest', 'assets', 'notified_ids')
+
+
+class UserSettings(MutableMapping):
+    """
+    Представление настроек одного пользователя поверх SettingsStore с тем же интерфейсом,
+    что и прежний словарь: settings['min_profit'], settings['price_range'] = (min, max), settings.get('digest').
+    Само ничего не хранит, кроме ссылки на хранилище и номера слота. Нужно обработчикам команд;
+    стадия match конвейера читает массивы хранилища напрямую (SettingsStore.match_rows).
+    """
+
+    __slots__ = ('_store', '_slot')
+
+    def __init__(self, store: 'SettingsStore', slot: int):
+        self._store = store
+        self._slot = slot
+
+    def __getitem__(self, key):
+        store, slot = self._store, self._slot
+        if key == 'min_profit':
+            return store.min_profit[slot]
+        if key == 'interval':
+            return store.interval[slot]
+        if key == 'price_range':
+            return (store.price_min[slot], store.price_max[slot])
+        if key == 'active':
+            return store.active.get(slot)
+        if key == 'digest':
+            return store.digest.get(slot)
+        if key == 'assets':
+            return store.assets_from_mask(store.asset_mask[slot])
+        if key == 'notified_ids':
+            return store.notified(slot)
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        store, slot = self._store, self._slot
+        if key == 'min_profit':
+            store.min_profit[slot] = int(value)
+        elif key == 'interval':
+            store.interval[slot] = int(value)
+        elif key == 'price_range':
+            store.price_min[slot], store.price_max[slot] = value
+        elif key == 'active':
+            store.active.set(slot, value)
+        elif key == 'digest':
+            store.digest.set(slot, value)
+        elif key == 'assets':
+            store.asset_mask[slot] = store.mask_from_assets(value)
+        elif key == 'notified_ids':
+            store.notified_ids[slot] = set(value) or None
+        else:
+            raise KeyError(key)
+
+    def __delitem__(self, key):
+        raise TypeError("Поля настроек пользователя нельзя удалять")
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    def __repr__(self):
+        return f"UserSettings({dict(self)!r})"
+
+
+class Bitset:
+    """Набор флагов по номерам слотов, по одному биту на слот."""
+
+    def __init__(self):
+        self._bits = bytearray()
+
+    def get(self, slot: int) -> bool:
+        byte = slot >> 3
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << (slot & 7)))
+
+    def set(self, slot: int, value: bool):
+        byte = slot >> 3
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte - len(self._bits) + 1))
+        if value:
+            self._bits[byte] |= 1 << (slot & 7)
+        else:
+            self._bits[byte] &= ~(1 << (slot & 7)) & 0xFF
+
+    def count(self) -> int:
+        return sum(bin(byte).count('1') for byte in self._bits)
+
+
+class SettingsStore:
+    """
+    Компактное хранилище настроек пользователей: каждому user_id выдаётся плотный номер слота,
+    числовые поля лежат в типизированных массивах array, флаги active и digest — в битовых наборах,
+    выбранные валюты — в битовой маске по общему списку валют (0 — все сканируемые).
+    Вместо словаря на пользователя хранятся несколько непрерывных массивов, поэтому проход по всем
+    пользователям за тик читает память последовательно. Обработчикам отдаются представления UserSettings,
+    конвейеру — кортежи match_rows, собранные из массивов один раз за тик.
+    """
+
+    def __init__(self):
+        self.slots = {}
+        self.user_ids = array('q')
+        # 'q', а не 'i': в БД (SQLite INTEGER) могут лежать значения больше 2^31, заданные до ограничений в командах
+        self.min_profit = array('q')
+        self.interval = array('q')
+        self.price_min = array('d')
+        self.price_max = array('d')
+        self.active = Bitset()
+        self.digest = Bitset()
+        self.asset_mask = array('Q')
+        self.asset_names = []
+        self._asset_bits = {}
+        # Множества уже отправленных лотов по слотам; у пользователя без уведомлений — None, set заводится при первом
+        self.notified_ids = []
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def get(self, user_id: int) -> UserSettings | None:
+        slot = self.slots.get(user_id)
+        return UserSettings(self, slot) if slot is not None else None
+
+    def add(self, user_id: int, prefs: dict) -> UserSettings:
+        """Заводит (или перезаписывает) настройки пользователя из словаря формата db.get_user_prefs."""
+        slot = self.slots.get(user_id)
+        if slot is None:
+            slot = len(self.user_ids)
+            self.slots[user_id] = slot
+            self.user_ids.append(user_id)
+            self.min_profit.append(0)
+            self.interval.append(0)
+            self.price_min.append(0.0)
+            self.price_max.append(0.0)
+            self.asset_mask.append(0)
+            self.notified_ids.append(None)
+
+        settings = UserSettings(self, slot)
+        for key in FIELDS:
+            if key in prefs:
+                settings[key] = prefs[key]
+        return settings
+
+    def mask_from_assets(self, assets) -> int:
+        """Битовая маска набора валют; None или пустой набор — 0 (все сканируемые)."""
+        mask = 0
+        for asset in assets or ():
+            bit = self._asset_bits.get(asset)
+            if bit is None:
+                bit = self._asset_bits[asset] = len(self.asset_names)
+                self.asset_names.append(asset)
+            mask |= 1 << bit
+        return mask
+
+    def assets_from_mask(self, mask: int) -> tuple | None:
+        if not mask:
+            return None
+        return tuple(asset for bit, asset in enumerate(self.asset_names) if mask & (1 << bit))
+
+    def asset_bit(self, asset: str) -> int:
+        """Бит валюты в масках пользователей; 0, если валюту никто не выбирал."""
+        bit = self._asset_bits.get(asset)
+        return 1 << bit if bit is not None else 0
+
+    def notified(self, slot: int) -> set:
+        """Множество отправленных лотов слота (заводится при первом обращении)."""
+        notified = self.notified_ids[slot]
+        if notified is None:
+            notified = self.notified_ids[slot] = set()
+        return notified
+
+    def match_rows(self, user_ids) -> list:
+        """
+        Снимок настроек пользователей для стадии match: (user_id, слот, min_profit, мин. цена, макс. цена, маска валют).
+        Читается из массивов один раз за тик, дальше проверка лота не обращается к хранилищу.
+        """
+        slots = self.slots
+        min_profit, price_min, price_max, asset_mask = self.min_profit, self.price_min, self.price_max, self.asset_mask
+        rows = []
+        for user_id in user_ids:
+            slot = slots.get(user_id)
+            if slot is not None:
+                rows.append((user_id, slot, min_profit[slot], price_min[slot], price_max[slot], asset_mask[slot]))
+        return rows
+
+    def update(self, mapping: dict):
+        """Загружает настройки нескольких пользователей: {user_id: словарь настроек}."""
+        for user_id, prefs in mapping.items():
+            self.add(user_id, prefs)
+
+    def items(self):
+        for user_id, slot in self.slots.items():
+            yield user_id, UserSettings(self, slot)
+
+    def notified_by_user(self) -> dict:
+        """Копии непустых notified_ids в виде {user_id: set} для контрольной точки."""
+        return {
+            user_id: set(self.notified_ids[slot])
+            for user_id, slot in self.slots.items()
+            if self.notified_ids[slot]
+        }
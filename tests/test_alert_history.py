@@ -0,0 +1,38 @@
+import importlib
+
+import pytest
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    # db при импорте создаёт файл базы в текущем каталоге, поэтому импортируем его во временном
+    monkeypatch.chdir(tmp_path)
+    db = importlib.import_module("db")
+    monkeypatch.setattr(db, "DATABASE_NAME", str(tmp_path / "test.db"))
+    db.init_db()
+    return db
+
+
+def test_get_model_alerts_filters_by_model_and_time(db):
+    db.add_alerts([
+        (1, 101, "Plush Pepe", "Cozy", "TON", 10.0, 15.0, 35.0, 1000.0),
+        (2, 102, "Plush Pepe", "Cozy", "TON", 12.0, 15.0, 12.5, 2000.0),
+        (1, 103, "Plush Pepe", "Other", "TON", 10.0, 15.0, 35.0, 2000.0),
+        (3, 104, "Plush Pepe", "Cozy", "TON", 11.0, 15.0, 20.0, 3000.0),
+    ])
+
+    rows = db.get_model_alerts("Plush Pepe", "Cozy", since=1500.0, until=3000.0)
+
+    assert rows == [(2, 102, "TON", 12.0, 15.0, 12.5, 2000.0)]
+    assert [row[1] for row in db.get_model_alerts("Plush Pepe", "Cozy", since=0.0)] == [101, 102, 104]
+
+
+def test_get_model_alerts_uses_model_index(db):
+    conn = db.sqlite3.connect(db.DATABASE_NAME)
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT user_id FROM alerts WHERE name = ? AND model = ? AND ts >= ? AND ts < ?",
+        ("Plush Pepe", "Cozy", 0, 1),
+    ).fetchall()
+    conn.close()
+
+    assert any("idx_alerts_model_ts" in row[-1] for row in plan)
@@ -0,0 +1,60 @@
+import asyncio
+
+import analytics
+import pipeline
+import scanner
+import settings_store
+
+END_TS = 20_000.0
+
+
+def make_gift(bid: float, bid_count: int, fetched_at: float) -> dict:
+    return {
+        'gift_id': 1, 'gift_num': 1, 'name': 'Gift', 'model': 'Model', 'backdrop': 'Black', 'asset': 'TON',
+        'fetched_at': fetched_at,
+        'auction': {
+            'auctionEndTime': '1970-01-01T05:33:20.000Z',  # END_TS
+            'bidHistory': [{'amount': bid}] * bid_count,
+        },
+    }
+
+
+def run_ticks(snapshots: list) -> list:
+    """Прогоняет снимки через конвейер с аналитикой ставок и возвращает projected_bid лота после каждого тика."""
+    tracker = analytics.BidTracker(smoothing=0.3, horizon=600)
+    scan_pipeline = pipeline.ScanPipeline(lambda *args: (15.0, 'model'), None, tracker=tracker,
+                                          settings=settings_store.SettingsStore())
+    projected = []
+
+    async def run():
+        scan_pipeline.start()
+        for tick, auctions in enumerate(snapshots):
+            async def fetch():
+                return auctions
+            # Часы тика идут дальше, даже если снимок тот же
+            await scan_pipeline.run_tick(fetch, [], now=9000.0 + tick * 30)
+            projected.append(scan_pipeline.deals.lots[0]['projected_bid'])
+        await scan_pipeline.stop()
+
+    asyncio.run(run())
+    return projected
+
+
+def test_reused_snapshot_does_not_decay_bid_rate():
+    fresh = [[make_gift(10, 1, 9000.0)], [make_gift(20, 2, 9030.0)], [make_gift(30, 3, 9060.0)]]
+    # Тот же снимок ещё три раза (breaker разомкнут или снимок свежий): время ответа не меняется
+    projected = run_ticks(fresh + [fresh[-1]] * 3)
+
+    assert projected[0] is None
+    assert projected[2] > 30
+    assert projected[3:] == [projected[2]] * 3
+
+
+def test_parse_lot_without_end_time():
+    gift = make_gift(10, 1, 0.0)
+    gift['auction']['auctionEndTime'] = None
+
+    lot = scanner.parse_lot(gift)
+
+    assert lot['end_ts'] is None
+    assert lot['end_time'] == 'N/A'
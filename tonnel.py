@@ -0,0 +1,246 @@
+import asyncio
+import json
+import logging
+import random
+import time
+
+import curl_cffi
+
+import config
+
+logger = logging.getLogger(__name__)
+
+TONNEL_API_URL = "https://gifts3.tonnel.network/api"
+
+TONNEL_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 OPR/112.0.0.0",
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.5",
+    "Referer": "https://market.tonnel.network/",
+    "Content-Type": "application/json", # Важно: указываем JSON тип контента
+    "Origin": "https://market.tonnel.network",
+    "Connection": "keep-alive",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "cross-site",
+    "Sec-GPC": "1",
+    "Priority": "u=4",
+}
+
+# Коды ответа, при которых имеет смысл повторить запрос (троттлинг и ошибки сервера)
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи для tonnel: после failure_threshold неудач подряд запросы блокируются
+    на reset_timeout секунд (состояние open), затем пропускается один пробный запрос (half-open).
+    Пока пробный запрос не завершился, остальные запросы блокируются.
+    Успешный пробный запрос замыкает цепь, неудачный — снова размыкает.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def allow(self) -> bool:
+        """
+        Можно ли сейчас отправлять запрос. В half-open разрешает ровно один пробный запрос:
+        вызывающий обязан завершить его record_success(), record_failure() или release_probe().
+        """
+        if self.state == self.CLOSED:
+            return True
+        if self.probe_in_flight:
+            return False
+        if self.state == self.OPEN:
+            if time.time() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            logger.info("Circuit breaker tonnel: пробный запрос после паузы.")
+        self.probe_in_flight = True
+        return True
+
+    @property
+    def is_open(self) -> bool:
+        """Заблокированы ли сейчас запросы (без изменения состояния)."""
+        if self.state == self.CLOSED:
+            return False
+        if self.state == self.OPEN:
+            return time.time() - self.opened_at < self.reset_timeout
+        return self.probe_in_flight
+
+    def release_probe(self):
+        """Освобождает пробный запрос, прерванный без результата (например, при отмене задачи)."""
+        self.probe_in_flight = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("Circuit breaker tonnel: upstream восстановился, запросы возобновлены.")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning("Circuit breaker tonnel: %d неудач подряд, запросы приостановлены на %d сек.",
+                               self.failures, self.reset_timeout)
+            self.state = self.OPEN
+            self.opened_at = time.time()
+
+
+class TonnelClient:
+    """
+    Асинхронный клиент tonnel с повторами (экспоненциальная задержка со случайным разбросом),
+    размыкателем цепи и необязательными дублирующими (hedged) запросами для pageGifts.
+    on_request(endpoint, длительность) вызывается после каждого отправленного запроса (вместе с повторами);
+    запросы, не пропущенные размыкателем, не учитываются.
+    """
+
+    def __init__(self, on_request=None):
+        self.breaker = CircuitBreaker(config.TONNEL_BREAKER_THRESHOLD, config.TONNEL_BREAKER_RESET_TIMEOUT)
+        self.on_request = on_request
+        self._session = None
+
+    def _get_session(self):
+        # Сессия создаётся лениво, уже внутри работающего event loop
+        if self._session is None:
+            self._session = curl_cffi.AsyncSession(impersonate="chrome131")
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _send(self, endpoint: str, payload: dict, headers: dict | None = None):
+        # Сжатие (gzip/br) согласует сам curl_cffi: при impersonate он отправляет Accept-Encoding
+        # как браузер и распаковывает ответ
+        return await self._get_session().post(
+            f"{TONNEL_API_URL}/{endpoint}",
+            headers={**TONNEL_HEADERS, **headers} if headers else TONNEL_HEADERS,
+            json=payload,
+            timeout=config.TONNEL_TIMEOUT,
+            verify=False # ВНИМАНИЕ: Отключение проверки SSL-сертификата не рекомендуется в продакшене!
+        )
+
+    async def _send_hedged(self, endpoint: str, payload: dict, headers: dict | None = None):
+        """
+        Отправляет запрос и, если ответа нет дольше TONNEL_HEDGE_DELAY секунд, дублирует его.
+        Возвращается первый полученный ответ, второй запрос отменяется.
+        """
+        first = asyncio.create_task(self._send(endpoint, payload, headers))
+        done, _ = await asyncio.wait({first}, timeout=config.TONNEL_HEDGE_DELAY)
+        if done:
+            return first.result()
+
+        logger.debug("%s: нет ответа за %.1f сек., отправляем дублирующий запрос", endpoint, config.TONNEL_HEDGE_DELAY)
+        second = asyncio.create_task(self._send(endpoint, payload, headers))
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _backoff_delay(self, attempt: int, res=None) -> float:
+        """Задержка перед повтором: base * 2^attempt со случайным разбросом (full jitter), с учётом Retry-After."""
+        delay = random.uniform(0, min(config.TONNEL_BACKOFF_MAX, config.TONNEL_BACKOFF_BASE * 2 ** attempt))
+        if res is not None:
+            try:
+                delay = max(delay, float(res.headers.get("Retry-After", 0)))
+            except (TypeError, ValueError):
+                pass
+        return min(delay, config.TONNEL_BACKOFF_MAX)
+
+    async def post(self, endpoint: str, payload: dict, hedge: bool = False, headers: dict | None = None):
+        """
+        Отправляет POST-запрос к tonnel с повторами.
+        Возвращает ответ со статусом 200 (или 304 на условный запрос)
+        либо None, если upstream недоступен или цепь разомкнута.
+        """
+        if not self.breaker.allow():
+            logger.debug("%s: circuit breaker разомкнут, запрос пропущен", endpoint)
+            return None
+        is_probe = self.breaker.probe_in_flight
+        started = time.time()
+
+        try:
+            for attempt in range(config.TONNEL_MAX_RETRIES + 1):
+                res = None
+                try:
+                    if hedge:
+                        res = await self._send_hedged(endpoint, payload, headers)
+                    else:
+                        res = await self._send(endpoint, payload, headers)
+                except Exception as e:
+                    logger.warning("[WARN] %s: ошибка запроса (попытка %d): %s", endpoint, attempt + 1, e)
+                else:
+                    if res.status_code in (200, 304):
+                        self.breaker.record_success()
+                        return res
+                    logger.error("[ERROR] %s: HTTP %s - %s", endpoint, res.status_code, res.text[:500])
+                    if res.status_code not in RETRYABLE_STATUSES:
+                        # Ошибка клиента (например, устаревший AUTH_DATA) — повтор не поможет
+                        self.breaker.record_failure()
+                        return None
+
+                if attempt < config.TONNEL_MAX_RETRIES:
+                    await asyncio.sleep(self._backoff_delay(attempt, res))
+
+            self.breaker.record_failure()
+            return None
+        finally:
+            # Если пробный запрос прервали (отмена задачи), следующий запрос сможет стать пробным
+            if is_probe:
+                self.breaker.release_probe()
+            if self.on_request is not None:
+                self.on_request(endpoint, time.time() - started)
+
+    async def fetch_page_gifts(self, asset: str = "TON"):
+        """Запрашивает страницу активных аукционов (pageGifts) в валюте asset."""
+        payload = {
+            "page": 1,
+            "limit": 30,
+            "sort": '{"auctionEndTime":1,"gift_id":-1}',
+            "filter": json.dumps({"auction_id": {"$exists": True}, "status": "active", "asset": asset}, separators=(",", ":")),
+            "price_range": None,
+            "ref": 0,
+            "user_auth": config.AUTH_DATA # <--- ИСПОЛЬЗУЕМ config.AUTH_DATA
+        }
+        return await self.post("pageGifts", payload, hedge=config.TONNEL_HEDGE_PAGE_GIFTS)
+
+    async def fetch_filter_stats(self, etag: str | None = None, last_modified: str | None = None):
+        """
+        Запрашивает статистику floor-цен по всем моделям (filterStats). Цены в TON: параметр валюты
+        у этого эндпоинта не подтверждён, пересчёт в другие валюты — scanner.convert_floor.
+        Если известны ETag / Last-Modified прошлого ответа, запрос условный: при неизменных данных
+        сервер, поддерживающий это, отвечает 304 без тела.
+        """
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        # Ключ в payload должен быть "authData", как показано на скриншотах
+        payload = {
+            "authData": config.AUTH_DATA # Отправляем AUTH_DATA как строку
+        }
+        return await self.post("filterStats", payload, headers=headers)
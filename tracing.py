@@ -0,0 +1,116 @@
+import collections
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Длительности запросов к tonnel (pageGifts, filterStats) и отрезки пути лота от появления в снимке до доставки
+SPANS = ('page_gifts', 'filter_stats', 'floor', 'match', 'deliver', 'total')
+
+# Отрезки для запросов к эндпоинтам tonnel
+REQUEST_SPANS = {'pageGifts': 'page_gifts', 'filterStats': 'filter_stats'}
+
+
+class LatencyTracer:
+    """
+    Трассировка задержки уведомлений: лот получает отметки first_seen (время получения первого снимка pageGifts,
+    в котором он появился),
+    floor_resolved (оценён на стадии enrich), matched (подошёл первому пользователю) и sent (доставлен).
+    По каждой доставке (пользователь, лот) в файл пишется JSON-строка с отметками и длительностями отрезков,
+    последние TRACE_WINDOW значений каждого отрезка хранятся в памяти для /latency.
+    Длительности самих запросов к tonnel приходят от TonnelClient через record_request().
+    Файл пишется через QueueHandler в отдельном потоке, чтобы запись не задерживала event loop.
+    """
+
+    def __init__(self, path: str | None = None, window: int | None = None):
+        self.path = path if path is not None else config.TRACE_PATH
+        self.durations = {span: collections.deque(maxlen=window or config.TRACE_WINDOW) for span in SPANS}
+        self.first_seen = {}
+        self._seen_in_tick = set()
+        self._tick_time = 0.0
+        self._listener = None
+        self._trace_logger = None
+        if self.path:
+            handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=config.TRACE_MAX_BYTES,
+                                                           backupCount=config.TRACE_BACKUP_COUNT, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            records = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(records, handler)
+            self._listener.start()
+            self._trace_logger = logging.getLogger(f"{__name__}.file")
+            self._trace_logger.propagate = False
+            self._trace_logger.setLevel(logging.INFO)
+            self._trace_logger.addHandler(logging.handlers.QueueHandler(records))
+            logger.info("Трассировка задержек уведомлений пишется в %s", self.path)
+
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def start_tick(self, fetched_at: float):
+        """
+        Начинает тик: fetched_at — время получения снимка pageGifts, от него считается first_seen новых лотов.
+        Если снимок взят из прошлого тика или контрольной точки, это время его исходного получения.
+        """
+        self._tick_time = fetched_at
+        self._seen_in_tick = set()
+
+    def record_request(self, endpoint: str, duration: float):
+        """Добавляет замер запроса к tonnel (с повторами), отправленного на самом деле."""
+        span = REQUEST_SPANS.get(endpoint)
+        if span is not None:
+            self.durations[span].append(duration)
+
+    def end_tick(self):
+        """Забывает лоты, которых не было в последнем снимке."""
+        for gift_id in self.first_seen.keys() - self._seen_in_tick:
+            del self.first_seen[gift_id]
+
+    def seen(self, lot: dict):
+        gift_id = lot['gift_id']
+        self._seen_in_tick.add(gift_id)
+        lot['trace'] = {'first_seen': self.first_seen.setdefault(gift_id, self._tick_time)}
+
+    def stamp(self, lot: dict, event: str):
+        """Ставит отметку event, если её ещё нет (matched ставится при первом подошедшем пользователе)."""
+        trace = lot.get('trace')
+        if trace is not None and event not in trace:
+            trace[event] = time.time()
+
+    def sent(self, user_id: int, lots: list):
+        """Фиксирует доставку уведомления о лотах пользователю и записывает трассы."""
+        sent_at = time.time()
+        for lot in lots:
+            trace = lot.get('trace')
+            if trace is None or 'matched' not in trace:
+                continue
+            spans = {
+                'floor': trace['floor_resolved'] - trace['first_seen'],
+                'match': trace['matched'] - trace['floor_resolved'],
+                'deliver': sent_at - trace['matched'],
+                'total': sent_at - trace['first_seen'],
+            }
+            for span, duration in spans.items():
+                self.durations[span].append(duration)
+            if self._trace_logger is not None:
+                self._trace_logger.info(json.dumps({
+                    'gift_id': lot['gift_id'], 'user_id': user_id, **trace, 'sent': sent_at,
+                    'durations': {span: round(duration, 4) for span, duration in spans.items()},
+                }))
+
+    def summary(self) -> dict:
+        """Перцентили длительности отрезков по последним замерам: {отрезок: (кол-во, p50, p95, макс)}."""
+        result = {}
+        for span, values in self.durations.items():
+            if not values:
+                continue
+            ordered = sorted(values)
+            last = len(ordered) - 1
+            result[span] = (len(ordered), ordered[last // 2], ordered[int(last * 0.95)], ordered[-1])
+        return result
@@ -0,0 +1,84 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+WATCH = 'watch'
+BLOCK = 'block'
+
+
+def _key(value: str) -> str:
+    # Названия сравниваются без учёта регистра: пользователь вводит их вручную
+    return value.strip().casefold()
+
+
+class _ListIndex:
+    """Хэш-индексы одного вида списков: название, название + модель и фон -> множество user_id."""
+
+    def __init__(self):
+        self.by_name = {}
+        self.by_model = {}
+        self.by_backdrop = {}
+        self.users = set()
+
+    def add(self, user_id: int, name: str, model: str, backdrop: str):
+        if backdrop:
+            self.by_backdrop.setdefault(_key(backdrop), set()).add(user_id)
+        elif model:
+            self.by_model.setdefault((_key(name), _key(model)), set()).add(user_id)
+        else:
+            self.by_name.setdefault(_key(name), set()).add(user_id)
+        self.users.add(user_id)
+
+    def match(self, name: str, model: str, backdrop: str) -> set:
+        """Пользователи, у которых в списке есть название, название + модель или фон лота."""
+        name = _key(name)
+        result = set()
+        for users in (self.by_name.get(name), self.by_model.get((name, _key(model))), self.by_backdrop.get(_key(backdrop))):
+            if users:
+                result |= users
+        return result
+
+
+class WatchlistIndex:
+    """
+    Скомпилированные списки отслеживания и блокировки всех пользователей.
+    По лоту за несколько обращений к словарям находятся пользователи, чей список отслеживания его содержит
+    (watched), и пользователи, заблокировавшие его (blocked). Пользователи без списка отслеживания
+    получают все лоты, кроме заблокированных, как и раньше.
+    Строится заново при каждом изменении списков командами.
+    """
+
+    def __init__(self):
+        self.watch = _ListIndex()
+        self.block = _ListIndex()
+
+    @classmethod
+    def build(cls, rows) -> 'WatchlistIndex':
+        """Строит индекс из строк (user_id, список, название, модель, фон) таблицы user_filters."""
+        index = cls()
+        for user_id, list_name, name, model, backdrop in rows:
+            target = index.watch if list_name == WATCH else index.block
+            target.add(user_id, name, model, backdrop)
+        logger.info("Списки отслеживания: пользователей %d, блокировки: пользователей %d",
+                    len(index.watch.users), len(index.block.users))
+        return index
+
+    @property
+    def watchers(self) -> set:
+        """Пользователи, у которых есть список отслеживания."""
+        return self.watch.users
+
+    def lookup(self, lot: dict) -> tuple[set, set]:
+        """Возвращает (watched, blocked) для лота."""
+        watched = self.watch.match(lot['name'], lot['model'], lot['backdrop']) if self.watch.users else set()
+        blocked = self.block.match(lot['name'], lot['model'], lot['backdrop']) if self.block.users else set()
+        return watched, blocked
+
+    def allows(self, user_id: int, lot: dict) -> bool:
+        """Проходит ли лот списки пользователя (для отбора по одному пользователю, например в /deals)."""
+        if user_id not in self.watch.users and user_id not in self.block.users:
+            return True
+        watched, blocked = self.lookup(lot)
+        if user_id in blocked:
+            return False
+        return user_id not in self.watch.users or user_id in watched